@@ -0,0 +1,44 @@
+"""
+Times loading models from cmpx, json and bnz files (and model cache hits)
+on synthetic networks of increasing size
+
+    python benchmarks/parsing.py [n_nodes ...]
+
+A shortcut for benchmarks/run.py restricted to the parsing cases, see
+there for the options and saved results. Exits with an error if loading a
+bnz file or a model cache hit misses its target relative to parsing the
+same model from cmpx.
+"""
+
+import sys
+
+from run import main
+
+
+PARSING_CASES = ['from_cmpx', 'from_json', 'from_bnz', 'cache_hit']
+
+# - Largest allowed ratio of each case's best time to from_cmpx
+TARGETS = {'from_bnz': 0.5, 'cache_hit': 0.5}
+
+
+def check(results):
+
+    parse = {r['n_nodes']: r['best'] for r in results if r['case'] == 'from_cmpx'}
+    failures = []
+
+    print('\nRatio to from_cmpx (target)')
+    for r in results:
+        if r['case'] in TARGETS:
+            ratio = r['best']/parse[r['n_nodes']]
+            print(f"{r['case']:>24} {r['n_nodes']:>7} nodes: {ratio:8.2f} ({TARGETS[r['case']]})")
+            if ratio > TARGETS[r['case']]:
+                failures.append(f"{r['case']} at {r['n_nodes']} nodes")
+
+    return failures
+
+
+if __name__ == '__main__':
+    failures = check(main(['--cases', *PARSING_CASES, '--sizes', *(sys.argv[1:] or ['1000', '2000', '5000', '10000'])]))
+
+    if failures:
+        sys.exit('Missed loading targets: ' + ', '.join(failures))
@@ -0,0 +1,200 @@
+"""
+Benchmark suite over synthetic networks of increasing size
+
+    python benchmarks/run.py [--sizes 20 100 500] [--cases fit sample ...] [--output results.json] [--compare old.json]
+
+Each case is timed on a random network (bn_zest.synthetic.random_network)
+of every size, keeping the best of --repeat runs. Results are saved as json
+with the environment so runs can be compared across versions.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bn_zest
+from bn_zest import BayesianNetwork, ModelCache
+from bn_zest.synthetic import random_network
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def _evidence(model, n_rows, fraction=0.2, seed=0):
+
+    """
+    Returns a DataFrame of sampled states with all but fraction of the values missing
+    """
+
+    X = model.sample(n_rows, engine='forward', random_state=seed).astype(object)
+    X.columns = model.variable_ids
+    return X.mask(np.random.default_rng(seed).random(X.shape) > fraction)
+
+
+def _evidence_dict(model, fraction=0.2, seed=0):
+    row = _evidence(model, 1, fraction=fraction, seed=seed).iloc[0]
+    return {idx: state for idx, state in row.items() if isinstance(state, str)}
+
+
+# - Each case returns a function to time, set up outside the timed region
+def case_from_cmpx(model, directory, options):
+    filename = os.path.join(directory, 'model.cmpx')
+    model.to_cmpx(filename)
+    return lambda: BayesianNetwork.from_cmpx(filename)
+
+
+def case_from_json(model, directory, options):
+    filename = os.path.join(directory, 'model.json')
+    model.to_json(filename)
+    return lambda: BayesianNetwork.from_json(filename)
+
+
+def case_from_bnz(model, directory, options):
+    filename = os.path.join(directory, 'model.bnz')
+    model.to_bnz(filename)
+    return lambda: BayesianNetwork.from_bnz(filename)
+
+
+def case_cache_hit(model, directory, options):
+    filename = os.path.join(directory, 'model.cmpx')
+    model.to_cmpx(filename)
+    cache = ModelCache(os.path.join(directory, 'cache'))
+    cache.load(filename)
+    return lambda: cache.load(filename)
+
+
+def case_to_cmpx(model, directory, options):
+    return lambda: model.to_cmpx(os.path.join(directory, 'output.cmpx'))
+
+
+def case_to_json(model, directory, options):
+    return lambda: model.to_json(os.path.join(directory, 'output.json'))
+
+
+def case_compile_exact(model, directory, options):
+    return lambda: model._invalidate(structure=True) or model.compile('exact')
+
+
+def case_predict_proba_dict(model, directory, options):
+    X = _evidence_dict(model)
+    model.compile(options.engine)
+    return lambda: model.predict_proba(X, engine=options.engine)
+
+
+def case_predict_proba_DataFrame(model, directory, options):
+    X = _evidence(model, options.rows)
+    model.compile(options.engine)
+    return lambda: model.predict_proba(X, engine=options.engine)
+
+
+def case_predict(model, directory, options):
+    X = _evidence(model, options.rows)
+    model.compile(options.engine)
+    return lambda: model.predict(X, engine=options.engine)
+
+
+def case_sample(model, directory, options):
+    return lambda: model.sample(options.samples, engine='forward', random_state=0, output='codes')
+
+
+def case_fit(model, directory, options):
+    X = model.sample(options.samples, engine='forward', random_state=0)
+    X.columns = model.variable_ids
+    return lambda: model.fit(X, engine='counts')
+
+
+CASES = {name[5:]: case for name, case in globals().items() if name.startswith('case_')}
+
+
+def environment():
+    return {
+        'bn_zest': bn_zest.__version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+
+def run(options):
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for n_nodes in options.sizes:
+            model = random_network(
+                n_nodes, n_states=tuple(options.states), max_in_degree=options.in_degree,
+                treewidth=options.treewidth, seed=options.seed
+            )
+
+            for name in options.cases:
+                function = CASES[name](model, directory, options)
+
+                times = []
+                for _ in range(options.repeat):
+                    start = time.perf_counter()
+                    function()
+                    times.append(time.perf_counter() - start)
+
+                results.append({'case': name, 'n_nodes': n_nodes, 'best': min(times), 'mean': sum(times)/len(times)})
+                print(f"{name:>24} {n_nodes:>7} nodes: {min(times):10.4f}s")
+
+    return results
+
+
+def compare(results, filename):
+
+    with open(filename, 'r') as file:
+        previous = {(r['case'], r['n_nodes']): r['best'] for r in json.load(file)['results']}
+
+    print(f'\nRatio to {filename} (> 1 is slower)')
+    for r in results:
+        if (r['case'], r['n_nodes']) in previous:
+            print(f"{r['case']:>24} {r['n_nodes']:>7} nodes: {r['best']/previous[(r['case'], r['n_nodes'])]:8.2f}")
+
+
+def main(args=None):
+
+    parser = argparse.ArgumentParser(description='bn_zest benchmark suite')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20, 100, 500], help='numbers of nodes')
+    parser.add_argument('--states', type=int, nargs=2, default=[2, 4], help='range of the number of states of each node')
+    parser.add_argument('--in-degree', type=int, default=3, help='maximum number of parents')
+    parser.add_argument('--treewidth', type=int, default=6, help='bound on the treewidth')
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--engine', default='exact', help='inference engine for the prediction cases')
+    parser.add_argument('--rows', type=int, default=1000, help='rows of evidence for DataFrame predictions')
+    parser.add_argument('--samples', type=int, default=100000, help='rows sampled and fitted')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='results file, defaults to results/<time>.json')
+    parser.add_argument('--compare', default=None, help='previous results file to compare against')
+    options = parser.parse_args(args)
+
+    results = run(options)
+
+    output = options.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, time.strftime('%Y%m%d_%H%M%S') + '.json')
+
+    with open(output, 'w') as file:
+        json.dump({'environment': environment(), 'options': vars(options), 'results': results}, file, indent=2)
+
+    print(f'\nSaved to {output}')
+
+    if options.compare is not None:
+        compare(results, options.compare)
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,36 @@
+import importlib
 from ._version import __version__
-from .tables import *
-from .nodes import *
-from .models import *
+
+# - The submodules pull in pomegranate and pandas, so each name is only
+# imported from its own module when it is first used (e.g. bn_zest.BayesianNetwork)
+_ATTRIBUTES = {
+    'PriorProbabilityTable': 'tables',
+    'ConditionalProbabilityTable': 'tables',
+    'Node': 'nodes',
+    'BayesianNetwork': 'models',
+    'ModelCache': 'cache',
+    'Profiler': 'profiling',
+    'QueryCache': 'querycache'
+}
+
+__all__ = list(_ATTRIBUTES)
+
+
+def __getattr__(name):
+
+    if name.startswith('__'):
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+    if name in _ATTRIBUTES:
+        value = getattr(importlib.import_module(f'.{_ATTRIBUTES[name]}', __name__), name)
+        globals()[name] = value
+        return value
+
+    try:
+        return importlib.import_module(f'.{name}', __name__)
+    except ModuleNotFoundError:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
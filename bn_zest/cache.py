@@ -0,0 +1,130 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+from ._version import __version__
+from .models import BayesianNetwork
+
+
+class ModelCache:
+
+    """
+    On-disk cache of parsed models keyed on the content hash of the source
+    file, the bn_zest version and the loading options. Models are stored in
+    the bnz format and loaded memory-mapped without checking the npts again
+    or building the pomegranate tables until they are needed, entries are
+    evicted least recently used first once the cache exceeds max_size bytes.
+
+    Kwargs:
+    directory [=None] (str) - cache directory, defaults to $BN_ZEST_CACHE_DIR or ~/.cache/bn_zest
+    max_size [=2**30] (int) - maximum total size of the cached models in bytes
+    """
+
+    def __init__(self, directory=None, max_size=2**30):
+
+        if directory is None:
+            directory = os.environ.get('BN_ZEST_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'bn_zest'))
+
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(filename, **kwargs):
+
+        """
+        Returns the cache key of a model file loaded with the given options
+        """
+
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as file:
+            for block in iter(lambda: file.read(2**20), b''):
+                digest.update(block)
+
+        options = json.dumps({'version': __version__, 'format': os.path.splitext(filename)[1].lower(), **kwargs}, sort_keys=True)
+        digest.update(options.encode('utf-8'))
+
+        return digest.hexdigest()
+
+    def load(self, filename, **kwargs):
+
+        """
+        Returns the model in a cmpx or json file, from the cache if the same
+        file has been loaded with the same options before
+
+        Args:
+        filename (str) - path to cmpx or json
+
+        Optional kwargs: passed on to BayesianNetwork.from_cmpx/from_json
+        """
+
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in ['.cmpx', '.json']:
+            raise ValueError('Only cmpx and json files can be cached')
+
+        path = os.path.join(self.directory, f'{self.key(filename, **kwargs)}.bnz')
+
+        if os.path.exists(path):
+            try:
+                model = BayesianNetwork.from_bnz(path)
+                os.utime(path)
+                self.hits += 1
+                return model
+            except (ValueError, KeyError, OSError):
+                # - Unreadable entries (e.g. a partial write) are rebuilt
+                os.remove(path)
+
+        self.misses += 1
+        model = getattr(BayesianNetwork, f'from_{extension[1:]}')(filename, **kwargs)
+
+        # - Written to a temporary file first so readers never see a partial entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(descriptor)
+        try:
+            model.to_bnz(temporary)
+            os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+        self.evict()
+
+        return model
+
+    def entries(self):
+
+        """
+        Returns the paths of the cached models, least recently used first
+        """
+
+        return sorted(glob.glob(os.path.join(self.directory, '*.bnz')), key=os.path.getmtime)
+
+    def size(self):
+        return sum(os.path.getsize(path) for path in self.entries())
+
+    def evict(self):
+
+        """
+        Removes the least recently used models until the cache fits within max_size
+        """
+
+        entries = self.entries()
+        size = sum(os.path.getsize(path) for path in entries)
+
+        for path in entries:
+            if size <= self.max_size:
+                break
+
+            size -= os.path.getsize(path)
+            os.remove(path)
+
+    def clear(self):
+        for path in self.entries():
+            os.remove(path)
+
+    def __repr__(self):
+        return f'ModelCache({self.directory}, hits={self.hits}, misses={self.misses})'
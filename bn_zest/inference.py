@@ -0,0 +1,408 @@
+import heapq
+import itertools
+import numpy as np
+
+
+def _triangulate(cardinalities, scopes):
+
+    """
+    Returns the maximal cliques of a triangulation of the moral graph of the
+    supplied factor scopes, using a greedy min-fill elimination order (ties
+    broken on the log-size of the resulting clique)
+    """
+
+    n = len(cardinalities)
+    log_card = np.log(np.asarray(cardinalities, dtype=float))
+
+    # - Moral graph
+    adjacency = [set() for _ in range(n)]
+    for scope in scopes:
+        for a in scope:
+            adjacency[a].update(b for b in scope if b != a)
+
+    def score(v):
+        nbrs = adjacency[v]
+        fill = sum(1 for a, b in itertools.combinations(nbrs, 2) if b not in adjacency[a])
+        return fill, log_card[v] + sum(log_card[u] for u in nbrs)
+
+    stamp = [0] * n
+    heap = [(*score(v), v, 0) for v in range(n)]
+    heapq.heapify(heap)
+
+    eliminated = [False] * n
+    cliques, containing = [], [[] for _ in range(n)]
+
+    while heap:
+        _, _, v, s = heapq.heappop(heap)
+        if eliminated[v] or (s != stamp[v]):
+            continue
+
+        nbrs = adjacency[v]
+        clique = frozenset(nbrs | {v})
+
+        # - Any clique containing this one was formed earlier and contains v
+        if not any(clique <= cliques[c] for c in containing[v]):
+            for u in clique:
+                containing[u].append(len(cliques))
+            cliques.append(clique)
+
+        for a in nbrs:
+            adjacency[a].update(nbrs)
+            adjacency[a].discard(a)
+            adjacency[a].discard(v)
+
+        eliminated[v] = True
+
+        affected = set(nbrs)
+        for a in nbrs:
+            affected.update(adjacency[a])
+
+        for u in affected:
+            if not eliminated[u]:
+                stamp[u] += 1
+                heapq.heappush(heap, (*score(u), u, stamp[u]))
+
+    return [tuple(sorted(clique)) for clique in cliques], containing
+
+
+def _spanning_tree(cliques, containing):
+
+    """
+    Returns the neighbours of each clique in a maximum weight spanning tree
+    (weighted by separator size), which satisfies the running intersection
+    property for the cliques of a chordal graph
+    """
+
+    edges = set()
+    for members in containing:
+        edges.update(itertools.combinations(sorted(members), 2))
+
+    edges = sorted(edges, key=lambda e: -len(set(cliques[e[0]]) & set(cliques[e[1]])))
+
+    root = list(range(len(cliques)))
+
+    def find(i):
+        while root[i] != i:
+            root[i] = root[root[i]]
+            i = root[i]
+        return i
+
+    neighbours = [[] for _ in cliques]
+    for i, j in edges:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            root[ri] = rj
+            neighbours[i].append(j)
+            neighbours[j].append(i)
+
+    return neighbours
+
+
+def relevant_factors(families, targets, evidence, observed):
+
+    """
+    Returns the indices of the factors needed for the posterior of the
+    targets. Barren nodes are dropped by keeping only the ancestors of the
+    targets and evidence, then the moral graph of those is cut at the
+    observed variables and only factors touching the component of the
+    targets are kept (the rest are d-separated from the targets).
+
+    Args:
+    families (list) - [variable, *parents] indices of each variable, factor i being the npt of variable i
+    targets (list) - indices of the query variables
+    evidence (list) - indices of the variables observed in any evidence row
+    observed (list) - indices of the variables observed in every evidence row
+    """
+
+    children = [[] for _ in families]
+    for family in families:
+        for parent in family[1:]:
+            children[parent].append(family[0])
+
+    # - Ancestral set of the targets and evidence
+    ancestral = set(targets) | set(evidence)
+    stack = list(ancestral)
+    while stack:
+        for parent in families[stack.pop()][1:]:
+            if parent not in ancestral:
+                ancestral.add(parent)
+                stack.append(parent)
+
+    # - Component of the targets in the moral graph of the ancestral set without the observed variables
+    observed = set(observed)
+    component = set(targets)
+    stack = list(targets)
+    while stack:
+        v = stack.pop()
+        for child in [v] + [child for child in children[v] if child in ancestral]:
+            for u in families[child]:
+                if (u not in component) and (u not in observed):
+                    component.add(u)
+                    stack.append(u)
+
+    return [v for v in sorted(ancestral) if not component.isdisjoint(families[v])]
+
+
+class JunctionTree:
+
+    """
+    Exact inference over a set of discrete factors by Shafer-Shenoy message
+    passing on a junction tree.
+
+    Args:
+    cardinalities (list) - number of states of each variable
+    scopes (list) - tuple of variable indices for each factor, the axes of the factor tables follow the same order
+    """
+
+    def __init__(self, cardinalities, scopes):
+
+        self.cardinalities = list(cardinalities)
+        self.scopes = [tuple(scope) for scope in scopes]
+
+        self.cliques, containing = _triangulate(self.cardinalities, self.scopes)
+        self.neighbours = _spanning_tree(self.cliques, containing)
+
+        size = [np.prod([self.cardinalities[v] for v in clique]) for clique in self.cliques]
+
+        # - Smallest clique containing each factor and each variable
+        self.assignment = [
+            min((c for c in containing[scope[0]] if set(scope) <= set(self.cliques[c])), key=size.__getitem__)
+            for scope in self.scopes
+        ]
+        self.home = [min(members, key=size.__getitem__) for members in containing]
+
+        self.separators = {
+            (i, j): tuple(v for v in self.cliques[i] if v in self.cliques[j])
+            for i, nbrs in enumerate(self.neighbours) for j in nbrs
+        }
+
+        # - Message schedule: collect towards a root of each component, then distribute
+        order, visited = [], [False] * len(self.cliques)
+        for r in range(len(self.cliques)):
+            if visited[r]:
+                continue
+            visited[r] = True
+            queue = [(r, None)]
+            while queue:
+                i, parent = queue.pop(0)
+                order.append((i, parent))
+                for j in self.neighbours[i]:
+                    if not visited[j]:
+                        visited[j] = True
+                        queue.append((j, i))
+
+        # - Bytes held per evidence row while passing messages: the likelihoods,
+        # every message and belief and the largest intermediate clique product
+        self.row_size = 8 * (
+            sum(self.cardinalities) + sum(size) + max(size, default=0) +
+            sum(int(np.prod([self.cardinalities[v] for v in separator])) for separator in self.separators.values())
+        )
+
+        self.roots = [i for i, parent in order if parent is None]
+        self.schedule = [(i, parent) for i, parent in reversed(order) if parent is not None] + \
+            [(parent, i) for i, parent in order if parent is not None]
+
+        self.potentials = None
+
+    def load(self, tables):
+
+        """
+        Sets the clique potentials from the factor tables (aligned with scopes)
+        """
+
+        potentials = [np.ones([self.cardinalities[v] for v in clique]) for clique in self.cliques]
+
+        for scope, table, c in zip(self.scopes, tables, self.assignment):
+            local = {v: k for k, v in enumerate(self.cliques[c])}
+            clique = list(range(len(self.cliques[c])))
+            potentials[c] = np.einsum(
+                potentials[c], clique,
+                np.asarray(table, dtype=float), [local[v] for v in scope],
+                clique
+            )
+
+        self.potentials = potentials
+
+    def _product(self, i, evidence, messages, n_rows, output, exclude=None):
+
+        """
+        Returns the product of the potential of clique i, the evidence homed
+        there and all incoming messages (except from exclude), summed onto
+        the output variables with the batch as the first axis
+        """
+
+        clique = self.cliques[i]
+        local = {v: k for k, v in enumerate(clique)}
+        batch = len(clique)
+
+        operands = [self.potentials[i], list(range(batch))]
+
+        for v in clique:
+            if (self.home[v] == i) and (v in evidence):
+                operands += [evidence[v], [batch, local[v]]]
+
+        for j in self.neighbours[i]:
+            if j != exclude:
+                operands += [messages[(j, i)], [batch] + [local[v] for v in self.separators[(j, i)]]]
+
+        if len(operands) == 2:
+            operands += [np.ones(n_rows), [batch]]
+
+        return np.einsum(*operands, [batch] + [local[v] for v in output])
+
+    def _contract(self, i, evidence, messages, n_rows, output, exclude=None):
+
+        """
+        Returns the product of _product normalised within each row
+        """
+
+        table = self._product(i, evidence, messages, n_rows, output, exclude=exclude)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return table/table.sum(axis=tuple(range(1, table.ndim)), keepdims=True)
+
+    def _message(self, i, j, evidence, messages, n_rows):
+        return self._contract(i, evidence, messages, n_rows, self.separators[(i, j)], exclude=j)
+
+    def _belief(self, i, evidence, messages, n_rows):
+        return self._contract(i, evidence, messages, n_rows, self.cliques[i])
+
+    def _marginal(self, belief, i, v):
+        k = self.cliques[i].index(v)
+        return belief.sum(axis=tuple(a + 1 for a in range(belief.ndim - 1) if a != k))
+
+    def likelihoods(self, evidence):
+
+        """
+        Returns a dictionary of likelihood arrays of shape (n_rows, n_states)
+        for each variable observed in any row of the integer coded evidence
+        """
+
+        evidence = np.atleast_2d(np.asarray(evidence, dtype=int))
+        n_rows = evidence.shape[0]
+
+        likelihoods = {}
+        for v in np.flatnonzero((evidence >= 0).any(axis=0)):
+            codes = evidence[:, v]
+            observed = codes >= 0
+            likelihood = np.ones((n_rows, self.cardinalities[v]))
+            likelihood[observed] = 0
+            likelihood[observed, codes[observed]] = 1
+            likelihoods[v] = likelihood
+
+        return likelihoods
+
+    def outward(self, root):
+
+        """
+        Returns the directed edges pointing away from the root clique within
+        its component, in breadth first order
+        """
+
+        edges, queue = [], [(root, None)]
+        while queue:
+            i, parent = queue.pop(0)
+            for j in self.neighbours[i]:
+                if j != parent:
+                    edges.append((i, j))
+                    queue.append((j, i))
+
+        return edges
+
+    def marginals(self, evidence, variables, max_memory=2**28):
+
+        """
+        Returns the posterior marginals of the requested variables. Rows are
+        processed in batches whose messages and beliefs take at most
+        max_memory bytes (a single row is never split).
+
+        Args:
+        evidence (ndarray) - integer array of shape (n_rows, n_variables) of observed state indices, -1 for missing
+        variables (list) - indices of the variables to return
+
+        Kwargs:
+        max_memory [=2**28] (int) - bytes of messages and beliefs held at once
+
+        Returns:
+        list of arrays of shape (n_rows, n_states) for each requested variable, rows with impossible evidence are nan
+        """
+
+        evidence = np.atleast_2d(np.asarray(evidence, dtype=int))
+        batch = max(1, max_memory // self.row_size)
+
+        if len(evidence) <= batch:
+            return self._marginals(evidence, variables)
+
+        results = [self._marginals(evidence[start:start + batch], variables) for start in range(0, len(evidence), batch)]
+        return [np.concatenate([result[k] for result in results]) for k in range(len(variables))]
+
+    def _marginals(self, evidence, variables):
+
+        n_rows = evidence.shape[0]
+        likelihoods = self.likelihoods(evidence)
+
+        messages = {}
+        for i, j in self.schedule:
+            messages[(i, j)] = self._message(i, j, likelihoods, messages, n_rows)
+
+        beliefs = {}
+        for v in variables:
+            if self.home[v] not in beliefs:
+                beliefs[self.home[v]] = self._belief(self.home[v], likelihoods, messages, n_rows)
+
+        return [self._marginal(beliefs[self.home[v]], self.home[v], v) for v in variables]
+
+    def expected_counts(self, evidence, weights=None):
+
+        """
+        Returns the expected counts of the joint states of every factor scope
+        summed over the (weighted) evidence rows, along with the log
+        probability of each row. Collect messages are normalised as they are
+        passed and their normalising constants give the probability of the
+        evidence.
+
+        Args:
+        evidence (ndarray) - integer array of shape (n_rows, n_variables) of observed state indices, -1 for missing
+
+        Kwargs:
+        weights [=None] (ndarray) - weight of each row, e.g. the number of times a pattern occurs
+
+        Returns:
+        counts (list) - arrays with the shape of each factor table
+        log_likelihood (ndarray) - log probability of the evidence in each row, -inf if impossible
+        """
+
+        evidence = np.atleast_2d(np.asarray(evidence, dtype=int))
+        n_rows = evidence.shape[0]
+        weights = np.ones(n_rows) if (weights is None) else np.asarray(weights, dtype=float)
+        likelihoods = self.likelihoods(evidence)
+
+        messages, log_likelihood = {}, np.zeros(n_rows)
+        n_collect = len(self.schedule)//2
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for k, (i, j) in enumerate(self.schedule):
+                if k < n_collect:
+                    table = self._product(i, likelihoods, messages, n_rows, self.separators[(i, j)], exclude=j)
+                    norm = table.sum(axis=tuple(range(1, table.ndim)))
+                    log_likelihood += np.log(norm)
+                    messages[(i, j)] = table/norm.reshape((-1,) + (1,) * (table.ndim - 1))
+                else:
+                    messages[(i, j)] = self._message(i, j, likelihoods, messages, n_rows)
+
+            for r in self.roots:
+                log_likelihood += np.log(self._product(r, likelihoods, messages, n_rows, ()))
+
+        # - Impossible rows have nan beliefs and contribute nothing
+        weights = np.where(np.isfinite(log_likelihood), weights, 0)
+
+        beliefs, counts = {}, []
+        for scope, c in zip(self.scopes, self.assignment):
+            if c not in beliefs:
+                beliefs[c] = np.nan_to_num(self._belief(c, likelihoods, messages, n_rows))
+
+            local = {v: k for k, v in enumerate(self.cliques[c])}
+            batch = len(local)
+            counts.append(np.einsum(beliefs[c], [batch] + list(range(batch)), weights, [batch], [local[v] for v in scope]))
+
+        return counts, log_likelihood
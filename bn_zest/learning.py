@@ -0,0 +1,86 @@
+import numpy as np
+
+
+def family_counts(codes, cardinalities, families, weights=None):
+
+    """
+    Counts the joint states of each family with a single bincount on its
+    mixed-radix index, rows with a missing member (-1) are skipped for that
+    family only
+
+    Args:
+    codes (ndarray) - integer array of shape (n_rows, n_variables) of state codes, -1 for missing
+    cardinalities (list) - number of states of each variable
+    families (list) - lists of [variable, *parents] indices
+
+    Kwargs:
+    weights [=None] (ndarray) - weight of each row, e.g. the number of times a pattern occurs
+
+    Returns:
+    list of count arrays of shape (n_states, *parent sizes), the layout of the npt values
+    """
+
+    codes = np.asarray(codes)
+    counts = []
+
+    for family in families:
+        shape = [cardinalities[j] for j in family]
+
+        index = codes[:, family[0]].astype(np.int64)
+        valid = index >= 0
+        for j, k in zip(family[1:], shape[1:]):
+            index = index * k + codes[:, j]
+            valid &= codes[:, j] >= 0
+
+        counts.append(np.bincount(
+            index[valid], None if (weights is None) else weights[valid], minlength=int(np.prod(shape))
+        ).astype(np.float64).reshape(shape))
+
+    return counts
+
+
+def normalise(counts, pseudocounts=0, values=None):
+
+    """
+    Returns the (MAP) estimate of a table from its counts and Dirichlet
+    pseudo-counts. Parent configurations without any counts keep their
+    current values, or are uniform if values is None
+    """
+
+    counts = counts + pseudocounts
+    total = counts.sum(axis=0, keepdims=True)
+
+    if values is None:
+        values = np.full(counts.shape, 1/len(counts))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total > 0, counts/total, values)
+
+
+def unique_patterns(chunks, n_columns):
+
+    """
+    Returns the distinct rows of a sequence of state code arrays with
+    n_columns columns and the number of times each occurs
+    """
+
+    patterns, weights = [np.empty((0, n_columns), dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    for codes in chunks:
+        unique, counts = np.unique(codes, axis=0, return_counts=True)
+        patterns.append(unique)
+        weights.append(counts)
+
+    patterns, inverse = np.unique(np.concatenate(patterns), axis=0, return_inverse=True)
+    weights = np.bincount(inverse.ravel(), np.concatenate(weights).astype(np.float64), minlength=len(patterns))
+
+    return patterns, weights
+
+
+def log_likelihood(counts, tables):
+
+    """
+    Returns the log probability of complete data summarised by its family counts
+    """
+
+    with np.errstate(divide='ignore'):
+        return sum(float(np.sum(c[c > 0] * np.log(np.asarray(t)[c > 0]))) for c, t in zip(counts, tables))
@@ -1,18 +1,40 @@
 import json
 import os
 import re
+import types
 import pomegranate
-from .parsers import from_cmpx, to_cmpx, from_dict
+from .parsers import from_cmpx, to_cmpx, from_dict, list_networks, to_bnz, read_bnz
 from .nodes import Node
+from collections import OrderedDict
+from .inference import JunctionTree, relevant_factors
+from .sessions import InferenceSession
+from .parallel import parallel_marginals
+from .sampling import ForwardSampler
+from .learning import family_counts, normalise, unique_patterns, log_likelihood
+from .profiling import Profiler, DISABLED, timed
+from .querycache import QueryCache
 import pandas as pd
 import numpy as np
 
 
+ENGINES = ['pomegranate', 'exact', 'lw']
+SAMPLERS = ['pomegranate', 'forward']
+FITTERS = ['pomegranate', 'counts', 'em']
+
+
 class BayesianNetwork(pomegranate.BayesianNetwork):
 
     def __init__(self, name, description=None, variables=None, **kwargs):
 
         super().__init__(name)
+        self.__junction_tree = None
+        self.__pruned = OrderedDict()
+        self.__sampler = None
+        self.__stale = set(ENGINES)
+        self.__variable_index = {}
+        self.__counts = None
+        self.__profiler = None
+        self.__query_cache = None
         self.add_states(*variables)
 
         self._check_variable_ids()
@@ -95,45 +117,471 @@ class BayesianNetwork(pomegranate.BayesianNetwork):
     def variable_ids(self):
         return [x.id for x in self.states]
 
+    @property
+    def variable_index(self):
+
+        """
+        Read-only mapping of variable id to its position in variables
+        """
+
+        return types.MappingProxyType(self.__variable_index)
+
     def _check_variable_ids(self):
-        var_ids = self.variable_ids
-        if len(np.unique(var_ids)) < len(var_ids):
+        if len(self.__variable_index) < len(self.states):
             raise ValueError('The ids of the provided variables are not unique')
 
-    def _get_dict_proba(self, X, output_variables, check_states=True, **kwargs):
+    def add_node(self, node):
+        super().add_node(node)
+        self.__variable_index.setdefault(node.id, len(self.states) - 1)
+        node._models.add(self)
+        self._invalidate(structure=True)
+
+    def add_edge(self, a, b):
+        super().add_edge(a, b)
+        self._invalidate(structure=True)
+
+    def _invalidate(self, structure=False):
+
+        """
+        Marks the compiled engines as out of date, called whenever the structure
+        or the npt of a contained variable changes
+        """
+
+        self.__stale = set(ENGINES)
+        self.__sampler = None
+
+        if self.__query_cache is not None:
+            self.__query_cache.clear()
+
+        # - Pruned junction trees keep their structure but reload their potentials
+        for pruned in self.__pruned.values():
+            pruned[2] = False
+
+        if structure:
+            self.__junction_tree = None
+            self.__pruned.clear()
+            self.__counts = None
+
+    def _compile_pomegranate(self):
+
+        # - Conditional tables build their pomegranate parameters here
+        for variable in self.variables:
+            if variable.npt._deferred:
+                variable.npt._build()
+
+        super().bake()
+
+    def _compile_exact(self):
+
+        if self.__junction_tree is None:
+            self.__junction_tree = JunctionTree([len(variable) for variable in self.variables], self._families())
+
+        self.__junction_tree.load([variable.npt.values for variable in self.variables])
+
+    def _compile_lw(self):
+        self._get_sampler()
+
+    def compile(self, engines='pomegranate'):
+
+        """
+        Prepares the inference engines up front, subsequent queries only
+        recompile after the structure or an npt has changed
+
+        Kwargs:
+        engines [='pomegranate'] (str, list) - engine(s) to compile, defaults to the default engine of
+            predict_proba. The exact engine's junction tree can grow exponentially on dense networks, so
+            it is only compiled when named (or first used).
+        """
+
+        if isinstance(engines, str):
+            engines = [engines]
+
+        for engine in engines:
+            if engine not in ENGINES:
+                raise ValueError(f"The engine '{engine}' is not recognised, use one of {ENGINES}")
+
+            with self._phase(f'compile_{engine}'):
+                getattr(self, f'_compile_{engine}')()
+            self.__stale.discard(engine)
+
+        return self
+
+    def _check_compiled(self, engine):
+        if engine in self.__stale:
+            self.compile(engine)
+
+    def bake(self):
+        self.compile('pomegranate')
+
+    def _get_junction_tree(self):
+        self._check_compiled('exact')
+        return self.__junction_tree
+
+    def _get_pruned_junction_tree(self, targets, evidence, observed):
+
+        """
+        Returns a junction tree over only the npts needed for the posterior
+        of the targets given the evidence (see inference.relevant_factors)
+        and the model indices of its variables. The most recently used trees
+        are kept for each combination of targets and evidence variables.
+        """
+
+        key = (tuple(targets), tuple(evidence), tuple(observed))
+        pruned = self.__pruned.get(key)
+
+        if pruned is None:
+            families = self._families()
+            factors = relevant_factors(families, targets, evidence, observed)
+
+            variables = sorted({v for i in factors for v in families[i]})
+            local = {v: k for k, v in enumerate(variables)}
+
+            junction_tree = JunctionTree(
+                [len(self.variables[v]) for v in variables],
+                [[local[v] for v in families[i]] for i in factors]
+            )
+
+            pruned = self.__pruned[key] = [junction_tree, variables, False, factors]
+
+            if len(self.__pruned) > 64:
+                self.__pruned.popitem(last=False)
+
+        self.__pruned.move_to_end(key)
+        junction_tree, variables, loaded, factors = pruned
+
+        if not loaded:
+            junction_tree.load([self.variables[i].npt.values for i in factors])
+            pruned[2] = True
+
+        return junction_tree, variables
+
+    def _exact_proba(self, evidence, output_variables, n_jobs=1, prune=False, max_memory=2**28):
+
+        """
+        Returns marginals of the output variables for an integer coded evidence
+        array of shape (n_rows, n_variables), -1 denoting missing values. With
+        prune, inference runs on a junction tree of only the npts relevant to
+        the output variables. Rows are passed through the tree in batches
+        whose messages fit in max_memory bytes.
+        """
+
+        variables = [i for i, _ in output_variables]
+
+        if prune:
+            observed = evidence >= 0
+            junction_tree, kept = self._get_pruned_junction_tree(
+                variables, np.flatnonzero(observed.any(axis=0)).tolist(), np.flatnonzero(observed.all(axis=0)).tolist()
+            )
+
+            local = {v: k for k, v in enumerate(kept)}
+            evidence, variables = evidence[:, kept], [local[v] for v in variables]
+        else:
+            junction_tree = self._get_junction_tree()
+
+        if n_jobs != 1:
+            return parallel_marginals(junction_tree, evidence, variables, n_jobs=n_jobs, max_memory=max_memory)
+
+        return junction_tree.marginals(evidence, variables, max_memory=max_memory)
+
+    def _lw_proba(self, evidence, output_variables, n_samples=10000, random_state=None, max_memory=2**28):
+
+        """
+        Returns likelihood weighting estimates of the marginals of the output
+        variables, with the effective sample size and standard errors
+        """
+
+        self._check_compiled('lw')
+
+        return self._get_sampler().likelihood_weighting(
+            evidence, [i for i, _ in output_variables], n_samples, np.random.default_rng(random_state), max_memory=max_memory
+        )
+
+    @property
+    def profiler(self):
+
+        """
+        The Profiler collecting phase timings, or None if profiling is disabled
+        """
+
+        return self.__profiler
+
+    def enable_profiling(self, profiler=None, callbacks=None):
+
+        """
+        Starts timing the phases of inference, sampling and fitting calls
+
+        Kwargs:
+        profiler [=None] (Profiler) - profiler to record to, e.g. one shared between models, defaults to a new one
+        callbacks [=None] (list) - functions called as callback(phase, elapsed) after every phase
+
+        Returns:
+        Profiler
+        """
+
+        self.__profiler = Profiler(callbacks=callbacks) if (profiler is None) else profiler
+        return self.__profiler
+
+    def disable_profiling(self):
+        self.__profiler = None
+
+    def _phase(self, name):
+        return DISABLED if (self.__profiler is None) else self.__profiler.phase(name)
+
+    def _increment(self, name, value=1):
+        if self.__profiler is not None:
+            self.__profiler.increment(name, value)
+
+    @property
+    def query_cache(self):
+
+        """
+        The QueryCache of dict query results, or None if caching is disabled
+        """
+
+        return self.__query_cache
+
+    def enable_query_cache(self, maxsize=1024):
+
+        """
+        Caches the results of predict_proba for dict evidence, keyed on the
+        evidence and query options. The cache is cleared whenever the
+        structure or an npt changes. The lw engine is only cached for an
+        integer random_state.
+
+        Kwargs:
+        maxsize [=1024] (int) - maximum number of results kept, least recently used are dropped first
+
+        Returns:
+        QueryCache
+        """
+
+        self.__query_cache = QueryCache(maxsize=maxsize)
+        return self.__query_cache
+
+    def disable_query_cache(self):
+        self.__query_cache = None
+
+    def _get_cached_dict_proba(self, X, output_variables, engine='pomegranate', **kwargs):
+
+        cache = self.__query_cache
+        if (cache is None) or ((engine == 'lw') and not isinstance(kwargs.get('random_state'), int)):
+            return self._get_dict_proba(X, output_variables, engine=engine, **kwargs)
+
+        key = cache.key(X, [variable.id for _, variable in output_variables], engine=engine, **kwargs)
+        result = cache.get(key)
+
+        if result is None:
+            result = self._get_dict_proba(X, output_variables, engine=engine, **kwargs)
+            cache.set(key, result)
+
+        return result
+
+    def session(self, X=None):
+
+        """
+        Returns an InferenceSession for interactive querying, which keeps the
+        exact engine's messages between calls and only updates those affected
+        by changes in evidence
+
+        Kwargs:
+        X [=None] (dict) - initial evidence
+        """
+
+        return InferenceSession(self, X=X)
+
+    def _get_dict_proba(self, X, output_variables, check_states=True, engine='pomegranate', **kwargs):
 
         # - Remove NoneTypes
         X = {key: value for key, value in X.items() if value is not None}
 
         # - Check states
         if check_states:
+            with self._phase('encode'):
+                for name, state in X.items():
+                    if state not in self[name].state_index:
+                        raise ValueError(f"The state '{state}' is not a state of {name}")
+
+        if engine != 'pomegranate':
+            evidence = np.full((1, len(self)), -1)
             for name, state in X.items():
-                if state not in self[name].states:
-                    raise ValueError(f"The state '{state}' is not a state of {name}")
-        prob = super(BayesianNetwork, self).predict_proba(X, **kwargs)
-        output = {
-            variable.id: [prob[i].parameters[0][state] for state in variable.states]
-            for i, variable in output_variables}
+                evidence[0, self.__variable_index[name]] = self[name].state_index[state]
+
+            prob, stats = self._get_codes_proba(evidence, list(range(len(self))), output_variables, engine=engine, **kwargs)
+            if any(np.isnan(p).any() for p in prob):
+                raise ValueError('The evidence supplied has zero probability')
+
+            with self._phase('assemble'):
+                output = {variable.id: p[0].tolist() for (_, variable), p in zip(output_variables, prob)}
+
+            if stats is None:
+                return output
+
+            return output, {
+                'ess': float(stats['ess'][0]),
+                'stderr': {variable.id: p[0].tolist() for (_, variable), p in zip(output_variables, stats['stderr'])}
+            }
+
+        with self._phase('inference'):
+            prob = super(BayesianNetwork, self).predict_proba(X, **kwargs)
+
+        with self._phase('assemble'):
+            output = {
+                variable.id: [prob[i].parameters[0][state] for state in variable.states]
+                for i, variable in output_variables}
 
         return output
 
-    def _get_DataFrame_proba(self, X, output_variables, **kwargs):
+    def _get_DataFrame_proba(self, X, output_variables, engine='pomegranate', **kwargs):
 
-        # - Check states
-        for name in X.columns:
-            for state in X[name].unique():
-                if (state not in self[name].states) and (state is not None):
-                    raise ValueError(f"The state '{state}' is not a state of {name}")
+        columns = [self.__variable_index[name] for name in X.columns]
+
+        with self._phase('encode'):
+            evidence = self._encode_DataFrame(X)
+
+        prob, stats = self._get_codes_proba(evidence, columns, output_variables, engine=engine, **kwargs)
+
+        with self._phase('assemble'):
+            output = pd.DataFrame({variable.id: p.tolist() for (_, variable), p in zip(output_variables, prob)})
+
+        if stats is None:
+            return output
+
+        return output, {
+            'ess': stats['ess'],
+            'stderr': pd.DataFrame({variable.id: p.tolist() for (_, variable), p in zip(output_variables, stats['stderr'])})
+        }
+
+    def _get_codes_proba(self, evidence, columns, output_variables, engine='pomegranate', n_jobs=1, return_stats=False, prune=False, **kwargs):
+
+        """
+        Returns the marginals of the output variables as arrays of shape
+        (n_rows, n_states) for integer coded evidence of the variables at the
+        column indices, running inference once per distinct evidence pattern.
+        Also returns the effective sample sizes and standard errors of the lw
+        engine if return_stats is True (otherwise None).
+        """
+
+        with self._phase('patterns'):
+            patterns, inverse = np.unique(evidence, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+
+            full_patterns = np.full((len(patterns), len(self)), -1)
+            full_patterns[:, columns] = patterns
+
+        self._increment('rows', len(evidence))
+        self._increment('patterns', len(patterns))
+
+        # - The pomegranate engine is timed per pattern within _get_dict_proba
+        if engine == 'exact':
+            with self._phase('inference'):
+                prob = self._exact_proba(full_patterns, output_variables, n_jobs=n_jobs, prune=prune, **kwargs)
+        elif engine == 'lw':
+            with self._phase('inference'):
+                prob, ess, stderr = self._lw_proba(full_patterns, output_variables, **kwargs)
+        else:
+            outputs = [
+                self._get_dict_proba({
+                    self.variables[i].id: self.variables[i].states[code]
+                    for i, code in zip(columns, pattern) if code >= 0
+                }, output_variables, check_states=False)
+                for pattern in patterns
+            ]
+            prob = [
+                np.array([output[variable.id] for output in outputs]).reshape(len(patterns), len(variable))
+                for _, variable in output_variables
+            ]
+
+        # - Scatter back to the original row order
+        if return_stats and (engine == 'lw'):
+            return [p[inverse] for p in prob], {'ess': ess[inverse], 'stderr': [p[inverse] for p in stderr]}
+
+        return [p[inverse] for p in prob], None
+
+    def _encode_DataFrame(self, X, codes=False):
+
+        """
+        Returns the (n_rows, n_columns) array of state codes of X (-1 for
+        missing), raising a single error listing every invalid value. Integer
+        columns are only read as state codes if codes is True
+        """
+
+        evidence = np.full((len(X), len(X.columns)), -1)
+        errors = []
+
+        for j, name in enumerate(X.columns):
+            evidence[:, j], invalid = self._encode_column(name, X[name], codes=codes)
+
+            if invalid.any():
+                rows = X.index[invalid]
+                values = ', '.join(f"'{value}'" for value in pd.unique(X[name][invalid]))
+                shown = ', '.join(str(row) for row in rows[:10]) + (', ...' if len(rows) > 10 else '')
+                errors.append(f"{values} in {len(rows)} row(s) [{shown}] of {name}")
+
+        if errors:
+            raise ValueError('Invalid states found: ' + '; '.join(errors))
+
+        return evidence
 
-        return pd.json_normalize(X.apply(lambda x: self._get_dict_proba(dict(x), output_variables, check_states=False, **kwargs), axis=1))
+    def _encode_column(self, name, values, codes=False):
 
-    def predict_proba(self, X=None, **kwargs):
+        """
+        Returns the state codes (-1 for missing) of a column of states or
+        Categorical values, or of integer codes if codes is True, along with a
+        mask of values that are not states (or codes) of the variable
+        """
+
+        states = self[name].states
+
+        if isinstance(values.dtype, pd.CategoricalDtype) and (list(values.cat.categories) == states):
+            codes = values.cat.codes.to_numpy()
+            return codes, np.zeros(len(codes), dtype=bool)
+
+        # - Values are otherwise matched against the states, so integers read
+        # from a file (e.g. states '1', '2', '3') are never mistaken for codes
+        if codes and pd.api.types.is_integer_dtype(values):
+            values = np.asarray(values)
+            return values, (values < -1) | (values >= len(states))
+
+        indices = pd.Index(states).get_indexer(values)
+        return indices, (indices == -1) & pd.notna(values)
+
+    @timed('predict_proba')
+    def predict_proba(self, X=None, engine='pomegranate', n_jobs=1, n_samples=10000, random_state=None, return_stats=False, targets=None, max_memory=2**28, **kwargs):
 
         """
 
         :X NoneType, dict, DataFrame:
         Either a dictionary or dataframe of input values
 
+        :engine str:
+        Inference engine, either 'pomegranate' (loopy belief propagation),
+        'exact' (junction tree over the npt arrays) or 'lw' (likelihood
+        weighting over the npt arrays)
+
+        :n_jobs int:
+        Number of worker processes used for DataFrame inputs with the exact
+        engine, -1 uses all cores
+
+        :n_samples int:
+        Number of samples per evidence row for the lw engine
+
+        :random_state int, Generator:
+        Seed or numpy Generator for the lw engine
+
+        :return_stats bool:
+        For the lw engine also return a dictionary with the effective sample
+        size ('ess') and standard errors ('stderr') of each evidence row
+
+        :targets list:
+        Ids of the variables to return, defaults to every variable without
+        evidence. The exact engine then only runs inference over the npts
+        relevant to the targets, dropping barren nodes and those d-separated
+        from the targets by the evidence
+
+        :max_memory int:
+        Bytes held at once by the exact engine's messages or the lw engine's
+        samples, evidence rows are processed in batches that fit
+
         :param args:
         :param kwargs: See
         :return: Marginal probabilities of output variables
@@ -146,47 +594,542 @@ class BayesianNetwork(pomegranate.BayesianNetwork):
         if (not isinstance(X, dict)) and (not isinstance(X, pd.DataFrame)):
             raise TypeError('X must be either a dictionary of pandas DataFrame')
 
+        if engine not in ENGINES:
+            raise ValueError(f"The engine '{engine}' is not recognised, use one of {ENGINES}")
+
+        if (n_jobs != 1) and (engine != 'exact'):
+            raise ValueError("n_jobs is only supported by the 'exact' engine")
+
         # - Check input ids
-        for idx in list(X.keys()):
-            if idx not in self.variable_ids:
+        with self._phase('check'):
+            for idx in list(X.keys()):
+                if idx not in self.__variable_index:
+                    raise KeyError(f'The node {idx} does not match any contained in the model')
+
+            if targets is None:
+                output_variables = [(i, variable) for i, variable in enumerate(self.variables) if variable.id not in X.keys()]
+            else:
+                for idx in targets:
+                    if idx not in self.__variable_index:
+                        raise KeyError(f'The node {idx} does not match any contained in the model')
+
+                    # - None means not observed, as everywhere else
+                    if (idx in X.keys()) and (isinstance(X, pd.DataFrame) or (X[idx] is not None)):
+                        raise ValueError(f'The target {idx} is also an input')
+
+                output_variables = [(self.__variable_index[idx], self[idx]) for idx in dict.fromkeys(targets)]
+
+        if engine == 'pomegranate':
+            self._check_compiled('pomegranate')
+
+        options = {
+            'n_samples': n_samples, 'random_state': random_state, 'return_stats': return_stats, 'max_memory': max_memory
+        } if (engine == 'lw') else {}
+
+        if engine == 'exact':
+            options['max_memory'] = max_memory
+
+        if (engine == 'exact') and (targets is not None):
+            options['prune'] = True
+
+        if isinstance(X, dict):
+            return self._get_cached_dict_proba(X, output_variables, engine=engine, **options)
+
+        return self._get_DataFrame_proba(X, output_variables, engine=engine, n_jobs=n_jobs, **options)
+
+    @timed('predict_proba_array')
+    def predict_proba_array(self, X, columns=None, engine='pomegranate', n_jobs=1, max_memory=2**28):
+
+        """
+        Returns marginal probabilities for integer coded evidence as a dense array
+
+        Args:
+        X (ndarray, DataFrame) - integer array of state codes (-1 for missing) of shape (n_rows, n_columns),
+            or DataFrame of Categorical/integer code columns named by variable id
+
+        Kwargs:
+        columns [=None] (list) - variable ids of the columns of an array X, defaults to all variables
+        engine [='pomegranate'] (str) - inference engine, see predict_proba
+        n_jobs [=1] (int) - number of worker processes for the exact engine
+        max_memory [=2**28] (int) - bytes of messages the exact engine holds at once, see predict_proba
+
+        Returns:
+        probs (ndarray) - array of shape (n_rows, total number of output states)
+        columns (MultiIndex) - (variable id, state) of each column of probs, in the order of variables
+        """
+
+        return self._get_array_proba(X, columns=columns, engine=engine, n_jobs=n_jobs, max_memory=max_memory, codes=True)
+
+    def _get_array_proba(self, X, columns=None, engine='pomegranate', n_jobs=1, max_memory=2**28, codes=True):
+
+        """
+        Returns the dense marginals and their columns for predict_proba_array
+        and predict. Integer DataFrame columns are read as state codes if
+        codes is True and otherwise matched against the states.
+        """
+
+        if engine not in ENGINES:
+            raise ValueError(f"The engine '{engine}' is not recognised, use one of {ENGINES}")
+
+        if (n_jobs != 1) and (engine != 'exact'):
+            raise ValueError("n_jobs is only supported by the 'exact' engine")
+
+        if isinstance(X, pd.DataFrame):
+            columns = list(X.columns)
+        elif columns is None:
+            columns = self.variable_ids
+
+        for idx in columns:
+            if idx not in self.__variable_index:
                 raise KeyError(f'The node {idx} does not match any contained in the model')
 
-        output_variables = [(self.variables.index(variable), variable) for variable in self.variables if variable.id not in list(X.keys())]
+        if isinstance(X, pd.DataFrame):
+            evidence = self._encode_DataFrame(X, codes=codes)
+        else:
+            evidence = np.asarray(X)
+            if (evidence.ndim != 2) or (evidence.shape[1] != len(columns)) or not np.issubdtype(evidence.dtype, np.integer):
+                raise ValueError(f'X must be an integer array of shape (n_rows, {len(columns)})')
+
+            for j, idx in enumerate(columns):
+                if self._encode_column(idx, evidence[:, j], codes=True)[1].any():
+                    raise ValueError(f"The codes for {idx} must be between -1 and {len(self[idx]) - 1}")
+
+        output_variables = [(i, variable) for i, variable in enumerate(self.variables) if variable.id not in columns]
+
+        if engine == 'pomegranate':
+            self._check_compiled('pomegranate')
+
+        options = {'max_memory': max_memory} if (engine == 'exact') else {}
+        prob, _ = self._get_codes_proba(
+            evidence, [self.__variable_index[idx] for idx in columns], output_variables, engine=engine, n_jobs=n_jobs, **options
+        )
 
-        self.bake()
+        output_columns = pd.MultiIndex.from_tuples(
+            [(variable.id, state) for _, variable in output_variables for state in variable.states],
+            names=['variable', 'state']
+        )
 
-        return getattr(self, f'_get_{type(X).__name__}_proba')(X, output_variables)
+        probs = np.concatenate(prob, axis=1) if prob else np.empty((len(evidence), 0))
 
-    def predict(self, X, *args, **kwargs):
+        return probs, output_columns
+
+    @timed('predict')
+    def predict(self, X, engine='pomegranate', n_jobs=1, max_memory=2**28):
+
+        """
+        Returns the most probable state of each output variable
+
+        Args:
+        X (DataFrame) - input values, see predict_proba
+
+        Kwargs:
+        engine [='pomegranate'] (str) - inference engine, see predict_proba
+        n_jobs [=1] (int) - number of worker processes for the exact engine
+        max_memory [=2**28] (int) - bytes of messages the exact engine holds at once, see predict_proba
+
+        Returns:
+        DataFrame of Categorical columns with the variables' states as categories
+        """
 
         if not isinstance(X, pd.DataFrame):
             raise TypeError('X must be a pandas DataFrame')
 
-        # - Construct apply function
-        def get_prediction(node):
-            def get_state(values):
-                return node.states[np.argmax(values)]
-            return get_state
+        # - X holds states, so integer columns are matched against the states rather than read as codes
+        probs, columns = self._get_array_proba(X, engine=engine, n_jobs=n_jobs, max_memory=max_memory, codes=False)
+
+        # - Pad every variable to the largest number of states and take a single argmax
+        ids = list(columns.get_level_values('variable').unique())
+        sizes = np.array([len(self[idx]) for idx in ids], dtype=int)
+        position = np.repeat(np.arange(len(ids)), sizes)
+        state = np.arange(len(position)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+        padded = np.full((len(probs), len(ids), sizes.max(initial=1)), -np.inf)
+        padded[:, position, state] = probs
+
+        codes = padded.argmax(axis=2)
+        codes[np.isnan(padded).any(axis=2)] = -1
+
+        return pd.DataFrame({
+            idx: pd.Categorical.from_codes(codes[:, j], categories=self[idx].states)
+            for j, idx in enumerate(ids)
+        })
+
+    def _get_sampler(self):
+
+        if self.__sampler is None:
+            self.__sampler = ForwardSampler(
+                [len(variable) for variable in self.variables],
+                [[self.__variable_index[parent.id] for parent in (variable.parents or [])] for variable in self.variables],
+                [variable.npt.values for variable in self.variables]
+            )
+
+        return self.__sampler
+
+    def _codes_to_DataFrame(self, codes):
+        return pd.DataFrame({
+            variable.name: pd.Categorical.from_codes(codes[:, i], categories=variable.states)
+            for i, variable in enumerate(self.variables)
+        })
+
+    @timed('sample')
+    def sample(self, n=1, *args, engine='pomegranate', random_state=None, output='categorical', chunk_size=None, **kwargs):
+
+        """
+        Returns samples from the network
+
+        Kwargs:
+        n [=1] (int) - number of samples
+        args - passed on to pomegranate's sample(n, evidences, algorithm, random_state)
+        engine [='pomegranate'] (str) - 'pomegranate' for pomegranate's samplers (args and kwargs are passed on)
+            or 'forward' for vectorised ancestral sampling over the npt arrays
+        random_state [=None] (int, Generator) - seed or numpy Generator
+        output [='categorical'] (str) - for the forward engine either 'categorical' for a DataFrame of Categorical
+            columns or 'codes' for an integer array of state codes of shape (n, n_variables)
+        chunk_size [=None] (int) - for the forward engine, returns a generator of chunks of at most chunk_size rows
+
+        Returns:
+        DataFrame with columns named by the variable names (or array/generator, see above)
+        """
+
+        if engine not in SAMPLERS:
+            raise ValueError(f"The engine '{engine}' is not recognised, use one of {SAMPLERS}")
 
-        X_pred = self.predict_proba(X).copy()
+        if engine == 'pomegranate':
+            self._check_compiled('pomegranate')
 
-        for col in X_pred.columns:
-            X_pred[col] = X_pred[col].apply(get_prediction(self[col]))
+            # - random_state may also be given positionally, after evidences and algorithm
+            if len(args) < 3:
+                kwargs['random_state'] = random_state
 
-        return X_pred
+            values = super(BayesianNetwork, self).sample(n, *args, **kwargs)
+            return pd.DataFrame(values, columns=self.variable_names)
+
+        if args:
+            raise TypeError("Positional arguments after n are only supported by the 'pomegranate' engine")
+
+        if output not in ['categorical', 'codes']:
+            raise ValueError(f"The output '{output}' is not recognised, use either 'categorical' or 'codes'")
+
+        sampler = self._get_sampler()
+        rng = np.random.default_rng(random_state)
+        convert = self._codes_to_DataFrame if (output == 'categorical') else (lambda codes: codes)
+
+        if chunk_size is None:
+            return convert(sampler.sample(n, rng))
+
+        return (convert(codes) for codes in sampler.chunks(n, chunk_size, rng))
+
+    @timed('sample_to_file')
+    def sample_to_file(self, filename, n, chunk_size=100000, file_format=None, random_state=None):
+
+        """
+        Streams forward samples to a csv or parquet file, holding at most one chunk in memory
+
+        Args:
+        filename (str) - path of the output file
+        n (int) - number of samples
+
+        Kwargs:
+        chunk_size [=100000] (int) - number of rows sampled and written at a time
+        file_format [=None] (str) - 'csv' or 'parquet', inferred from the file extension by default
+        random_state [=None] (int, Generator) - seed or numpy Generator
+        """
+
+        if file_format is None:
+            file_format = {'.csv': 'csv', '.parquet': 'parquet', '.pq': 'parquet'}.get(os.path.splitext(filename)[1].lower())
+
+        if file_format not in ['csv', 'parquet']:
+            raise ValueError('The file format must be either csv or parquet')
+
+        chunks = self.sample(n, engine='forward', random_state=random_state, output='codes', chunk_size=chunk_size)
+
+        if file_format == 'csv':
+            with open(filename, 'w', newline='') as file:
+                pd.DataFrame(columns=self.variable_names).to_csv(file, index=False)
+                for codes in chunks:
+                    self._codes_to_DataFrame(codes).to_csv(file, index=False, header=False)
+            return
+
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Writing parquet files requires pyarrow')
+
+        # - Dictionary encoded columns built directly from the state codes
+        dictionaries = [pa.array(variable.states, type=pa.string()) for variable in self.variables]
+        schema = pa.schema([
+            (variable.name, pa.dictionary(pa.from_numpy_dtype(self._get_sampler().dtype), pa.string()))
+            for variable in self.variables
+        ])
+
+        with pq.ParquetWriter(filename, schema) as writer:
+            for codes in chunks:
+                writer.write_table(pa.Table.from_arrays([
+                    pa.DictionaryArray.from_arrays(codes[:, i], dictionary)
+                    for i, dictionary in enumerate(dictionaries)
+                ], schema=schema))
+
+    def _families(self):
+
+        """
+        Returns the [variable, *parents] indices of each variable, the axes of its npt
+        """
 
-    def sample(self, *args, **kwargs):
-        self.bake()
+        return [
+            [i] + [self.__variable_index[parent.id] for parent in (variable.parents or [])]
+            for i, variable in enumerate(self.variables)
+        ]
+
+    def _encode_variables(self, X):
+
+        """
+        Returns the (n_rows, n_variables) array of state codes of X in the
+        order of variables, -1 for missing values and absent columns
+        """
+
+        for idx in X.columns:
+            if idx not in self.__variable_index:
+                raise KeyError(f'The node {idx} does not match any contained in the model')
+
+        codes = np.full((len(X), len(self)), -1, dtype=np.int64)
+        codes[:, [self.__variable_index[idx] for idx in X.columns]] = self._encode_DataFrame(X)
+
+        return codes
+
+    def _get_pseudocounts(self, pseudocount):
+
+        """
+        Returns the Dirichlet pseudo-counts of each variable from a single
+        value or a dict of values/arrays keyed by variable id
+        """
+
+        if not isinstance(pseudocount, dict):
+            return [pseudocount] * len(self)
+
+        for idx in pseudocount.keys():
+            if idx not in self.__variable_index:
+                raise KeyError(f'The node {idx} does not match any contained in the model')
+
+        return [np.asarray(pseudocount.get(variable.id, 0), dtype=np.float64) for variable in self.variables]
+
+    def _count(self, X):
+
+        """
+        Returns the family counts of each variable summed over X, a DataFrame
+        or an iterable of DataFrame chunks
+        """
+
+        chunks = [X] if isinstance(X, pd.DataFrame) else X
+        families = self._families()
+        cardinalities = [len(variable) for variable in self.variables]
+
+        counts = [np.zeros([cardinalities[j] for j in family]) for family in families]
+        for chunk in chunks:
+            for total, chunk_counts in zip(counts, family_counts(self._encode_variables(chunk), cardinalities, families)):
+                total += chunk_counts
+
+        return counts
+
+    def _fit_em(self, X, pseudocount=0, max_iter=100, tol=1e-6, batch_size=10000, verbose=False):
+
+        """
+        Expectation-maximisation over the distinct evidence patterns of X.
+        Complete patterns are counted once, the expected family counts of
+        incomplete patterns come from the exact engine in batches of at most
+        batch_size patterns. Returns the log-likelihood of the data at each
+        iteration.
+        """
+
+        chunks = [X] if isinstance(X, pd.DataFrame) else X
+        patterns, weights = unique_patterns((self._encode_variables(chunk) for chunk in chunks), len(self))
+
+        families = self._families()
+        cardinalities = [len(variable) for variable in self.variables]
+        pseudocounts = self._get_pseudocounts(pseudocount)
+
+        complete = (patterns >= 0).all(axis=1)
+        complete_counts = family_counts(patterns[complete], cardinalities, families, weights=weights[complete])
+        patterns, weights = patterns[~complete], weights[~complete]
+
+        history = []
+        for iteration in range(max_iter):
+
+            tables = [variable.npt.values for variable in self.variables]
+            junction_tree = self._get_junction_tree()
+
+            # - E step
+            counts = [c.copy() for c in complete_counts]
+            total = log_likelihood(complete_counts, tables)
+
+            for start in range(0, len(patterns), batch_size):
+                expected, row_log_likelihood = junction_tree.expected_counts(
+                    patterns[start:start + batch_size], weights[start:start + batch_size]
+                )
+
+                if not np.isfinite(row_log_likelihood).all():
+                    raise ValueError('The data supplied has zero probability under the current npts')
+
+                for c, e in zip(counts, expected):
+                    c += e
+
+                total += float(row_log_likelihood @ weights[start:start + batch_size])
+
+            if np.isneginf(total):
+                raise ValueError('The data supplied has zero probability under the current npts')
+
+            history.append(total)
+            if verbose:
+                print(f'Iteration {iteration}: log-likelihood {total:.6f}')
+
+            # - M step
+            for variable, c, p in zip(self.variables, counts, pseudocounts):
+                variable.npt = normalise(c, p, variable.npt.values)
+
+            if (iteration > 0) and (history[-1] - history[-2] < tol):
+                break
+
+        return history
+
+    @property
+    def counts(self):
+
+        """
+        Family counts of each variable accumulated by partial_fit, keyed by
+        variable id, or None before the first batch
+        """
 
-        values = super(BayesianNetwork, self).sample(*args, **kwargs)
-        return pd.DataFrame(values, columns=self.variable_names)
+        if self.__counts is None:
+            return None
 
-    def fit(self, X, y=None, **kwargs):
+        return {variable.id: counts for variable, counts in zip(self.variables, self.__counts)}
+
+    @counts.setter
+    def counts(self, counts):
+
+        if counts is None:
+            self.__counts = None
+            return
+
+        for idx in counts.keys():
+            if idx not in self.__variable_index:
+                raise KeyError(f'The node {idx} does not match any contained in the model')
+
+        values = []
+        for variable in self.variables:
+            shape = [len(variable), *variable.parent_sizes()]
+            value = np.asarray(counts[variable.id], dtype=np.float64) if (variable.id in counts) else np.zeros(shape)
+
+            if not np.array_equal(value.shape, shape):
+                raise ValueError(f"The counts supplied for '{variable.id}' should be of shape {shape}")
+
+            values.append(value)
+
+        self.__counts = values
+
+    @timed('partial_fit')
+    def partial_fit(self, X, y=None, decay=1, pseudocount=0):
+
+        """
+        Updates the npts from a new batch of data, keeping the family counts of
+        every batch so far (see counts) as sufficient statistics
+
+        Args:
+        X (DataFrame) - states of the variables in columns named by variable id, or an iterable of DataFrame chunks
+
+        Kwargs:
+        y [=None] (DataFrame) - further columns, concatenated to X
+        decay [=1] (float) - weight of the existing counts, below 1 exponentially forgets older batches
+        pseudocount [=0] (float, dict) - Dirichlet pseudo-counts, see fit
+        """
+
+        if not 0 < decay <= 1:
+            raise ValueError('decay must be greater than 0 and at most 1')
 
         if y is not None:
             X = pd.concat((X, y), axis=1)
 
-        super(BayesianNetwork, self).fit(X, **kwargs)
+        counts = self._count(X)
+        if self.__counts is not None:
+            counts = [decay * previous + new for previous, new in zip(self.__counts, counts)]
+
+        self.__counts = counts
+
+        for variable, c, p in zip(self.variables, counts, self._get_pseudocounts(pseudocount)):
+            variable.npt = normalise(c, p, variable.npt.values)
+
+        return self
+
+    @timed('fit')
+    def fit(self, X, y=None, engine='pomegranate', pseudocount=0, **kwargs):
+
+        """
+        Fits the npts of every variable to data
+
+        Args:
+        X (DataFrame) - states of the variables in columns named by variable id, for the counts
+            engine also an iterable of DataFrame chunks (e.g. pd.read_csv(..., chunksize=n))
+
+        Kwargs:
+        y [=None] (DataFrame) - further columns, concatenated to X
+        engine [='pomegranate'] (str) - 'pomegranate' for pomegranate's fit (kwargs are passed on), 'counts'
+            for maximum likelihood/MAP estimates from family counts over the npt arrays, where rows with
+            missing values are skipped only for the families they affect, or 'em' for expectation-maximisation
+            which also learns from rows with missing values
+        pseudocount [=0] (float, dict) - Dirichlet pseudo-counts added to every cell, for the counts and em
+            engines also a dict of values/arrays of the npt shape keyed by variable id
+
+        Optional kwargs (em engine):
+        max_iter [=100] (int) - maximum number of iterations
+        tol [=1e-6] (float) - stops once the log-likelihood improves by less than tol
+        batch_size [=10000] (int) - number of distinct evidence patterns passed through inference at a time
+        verbose [=False] (bool) - prints the log-likelihood of each iteration
+
+        The log-likelihood of the data at each em iteration is kept in log_likelihoods
+        """
+
+        if engine not in FITTERS:
+            raise ValueError(f"The engine '{engine}' is not recognised, use one of {FITTERS}")
+
+        if y is not None:
+            X = pd.concat((X, y), axis=1)
+
+        if engine == 'pomegranate':
+            self._check_compiled('pomegranate')
+            super(BayesianNetwork, self).fit(X, pseudocount=pseudocount, **kwargs)
+
+            # - pomegranate updates its parameters in place
+            for variable in self.variables:
+                variable.npt._refresh_values()
+
+            self._invalidate()
+            return self
+
+        if engine == 'em':
+            self.log_likelihoods = self._fit_em(X, pseudocount=pseudocount, **kwargs)
+            return self
+
+        for variable, counts, pseudocounts in zip(self.variables, self._count(X), self._get_pseudocounts(pseudocount)):
+            variable.npt = normalise(counts, pseudocounts, variable.npt.values)
+
+        return self
+
+    @staticmethod
+    def _read_cmpx(filename):
+        with open(filename, 'r') as file:
+            return json.load(file)
+
+    @staticmethod
+    def list_cmpx_networks(filename):
+
+        """
+        Returns the index, id, name and number of nodes of each network in a cmpx file
+
+        Args:
+        filename (str) - path to cmpx
+        """
+
+        return list_networks(BayesianNetwork._read_cmpx(filename))
 
     @classmethod
     def from_cmpx(cls, filename, network=0, **kwargs):
@@ -198,17 +1141,46 @@ class BayesianNetwork(pomegranate.BayesianNetwork):
         filename (str) - path to cmpx
         
         Kwargs:
-        network [=0] (int) - specifies which network to use
+        network [=0] (int, str) - index or name of the network to use
 
         Optional kwargs:
         remove_disconnected_variables [=True] (bool) - removes any disconnected variables from the model
         force_summation [=False] - forces values of the npt to equal 1
         """
 
-        with open(filename, 'r') as file:
-            data_string = file.read()
+        return cls(**from_cmpx(cls._read_cmpx(filename), network=network, **kwargs))
+
+    @classmethod
+    def from_cmpx_networks(cls, filename, networks=None, **kwargs):
+
+        """
+        Returns several BayesianNetwork models from a single parse of a cmpx
+        file, only building the networks requested
+
+        Args:
+        filename (str) - path to cmpx
 
-        return cls(**from_cmpx(json.loads(data_string), network=network, **kwargs))
+        Kwargs:
+        networks [=None] (list) - indices and/or names of the networks to load, defaults to all networks
+
+        Optional kwargs: see from_cmpx
+
+        Returns:
+        dict of models keyed by the requested index or name, or by network name when loading all networks
+            (which raises a ValueError if the names are missing or not unique)
+        """
+
+        data = cls._read_cmpx(filename)
+
+        if networks is None:
+            networks = [network['name'] for network in list_networks(data)]
+
+            if (None in networks) or (len(set(networks)) < len(networks)):
+                raise ValueError(f'The networks in {filename} do not have unique names, load them by index instead')
+
+            return {name: cls(**from_cmpx(data, network=i, **kwargs)) for i, name in enumerate(networks)}
+
+        return {network: cls(**from_cmpx(data, network=network, **kwargs)) for network in networks}
 
     @classmethod
     def from_dict(cls, data, **kwargs):
@@ -243,6 +1215,37 @@ class BayesianNetwork(pomegranate.BayesianNetwork):
            
         return cls.from_dict(json.loads(data_string), **kwargs)
 
+    @classmethod
+    def from_bnz(cls, filename, mmap=True, **kwargs):
+
+        """
+        Returns BayesianNetwork model from a binary bnz file (see to_bnz)
+
+        Args:
+        filename (str) - path to bnz
+
+        Kwargs:
+        mmap [=True] (bool) - memory-maps the npts so processes loading the same file share its pages
+
+        Optional kwargs:
+        force_summation [=False] - forces values of the npt to equal 1
+
+        The npts were checked when the file was written so are not checked
+        again, and the pomegranate tables are only built if the pomegranate
+        engine is used.
+        """
+
+        return cls.from_dict(read_bnz(filename, mmap=mmap), trusted=True, **kwargs)
+
+    def to_bnz(self, filename):
+
+        """
+        Writes the model to a binary bnz file: a JSON header with the to_dict
+        structure followed by a single float64 block holding every npt
+        """
+
+        to_bnz(self, filename)
+
     def to_cmpx(self, filename):
         data = json.dumps(to_cmpx(self), indent=2)
         with open(filename, 'w') as file:
@@ -259,6 +1262,10 @@ class BayesianNetwork(pomegranate.BayesianNetwork):
                 data[key] = getattr(self, key)
         
         data['variables'] = [variable.to_dict() for variable in self.variables]        
+
+        if self.__counts is not None:
+            data['counts'] = {idx: counts.tolist() for idx, counts in self.counts.items()}
+
         return data
 
     def to_json(self, filename=None):
@@ -272,7 +1279,16 @@ class BayesianNetwork(pomegranate.BayesianNetwork):
                 file.write(json_string)
 
     def __getitem__(self, item):
-        return self.states[self.variable_ids.index(item)]
+
+        """
+        Returns the variable with the id item. Unknown ids raise a KeyError
+        as for a dict (before the variable index they raised a ValueError)
+        """
+
+        if item not in self.__variable_index:
+            raise KeyError(f'The node {item} does not match any contained in the model')
+
+        return self.states[self.__variable_index[item]]
 
     def __str__(self):
         return self.name
@@ -1,12 +1,16 @@
 from pomegranate import State
 import re
 import json
+import weakref
 from .tables import PriorProbabilityTable, ConditionalProbabilityTable
 import numpy as np
 
 class Node(State):
 
-    def __init__(self, name, states, parents=None, npt=None, id=None, group=None, description=None):
+    def __init__(self, name, states, parents=None, npt=None, id=None, group=None, description=None, trusted=False):
+
+        # - Models containing this node, notified when the npt changes
+        self._models = weakref.WeakSet()
 
         self.parents = parents
         self.states = states
@@ -26,14 +30,16 @@ class Node(State):
             distribution = PriorProbabilityTable(
                 label=name,
                 states=self.states,
-                values=npt
+                values=npt,
+                trusted=trusted
             )
         else:
             distribution = ConditionalProbabilityTable(
                 label=name,
                 states=self.states,
                 parent_nodes=self.parents,
-                values=npt
+                values=npt,
+                trusted=trusted
             )
 
         super().__init__(distribution, name)
@@ -68,6 +74,12 @@ class Node(State):
         else:
             self.__states = states
 
+        self.__state_index = {state: i for i, state in enumerate(self.__states)}
+
+    @property
+    def state_index(self):
+        return self.__state_index
+
     def parent_sizes(self):
         parents = [] if (self.parents is None) else self.parents
         return [len(parent) for parent in parents]
@@ -87,6 +99,9 @@ class Node(State):
     def npt(self, values):
         self.distribution.values = values
 
+        for model in self._models:
+            model._invalidate()
+
     def to_dict(self):
         
         data = {
@@ -98,7 +113,7 @@ class Node(State):
         }
 
         data['parents'] = None if (self.parents is None) else [parent.id for parent in self.parents]
-        data['npt'] = self.npt.to_df().values.tolist()
+        data['npt'] = self.npt.values.reshape(len(self), -1).tolist()
         
         return data
 
@@ -0,0 +1,86 @@
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+# - Worker state, set once per process by _init_worker
+_junction_tree = None
+_shm = None
+
+
+def _init_worker(junction_tree, name, shapes):
+
+    global _junction_tree, _shm
+
+    _shm = shared_memory.SharedMemory(name=name)
+
+    buffer = np.ndarray((sum(int(np.prod(shape)) for shape in shapes),), dtype=np.float64, buffer=_shm.buf)
+
+    potentials, offset = [], 0
+    for shape in shapes:
+        size = int(np.prod(shape))
+        potentials.append(buffer[offset:offset + size].reshape(shape))
+        offset += size
+
+    junction_tree.potentials = potentials
+    _junction_tree = junction_tree
+
+
+def _marginals(evidence, variables, max_memory):
+    return _junction_tree.marginals(evidence, variables, max_memory=max_memory)
+
+
+def _get_n_jobs(n_jobs):
+    return os.cpu_count() if n_jobs in [None, -1] else n_jobs
+
+
+def parallel_marginals(junction_tree, evidence, variables, n_jobs=-1, n_chunks=None, max_memory=2**28):
+
+    """
+    Computes junction tree marginals over a process pool. The clique
+    potentials are copied once into a shared memory block which every worker
+    maps, so only the tree structure is pickled (once per worker) and the
+    evidence is split into chunks whose results are returned in order.
+
+    Args:
+    junction_tree (JunctionTree) - compiled junction tree
+    evidence (ndarray) - integer coded evidence of shape (n_rows, n_variables)
+    variables (list) - indices of the variables to return
+
+    Kwargs:
+    n_jobs [=-1] (int) - number of worker processes, -1 uses all cores
+    n_chunks [=None] (int) - number of chunks to split the rows into, defaults to 4 per worker
+    max_memory [=2**28] (int) - bytes of messages and beliefs each worker holds at once
+    """
+
+    # - Nothing to split, e.g. an empty DataFrame
+    if len(evidence) == 0:
+        return junction_tree.marginals(evidence, variables, max_memory=max_memory)
+
+    n_jobs = _get_n_jobs(n_jobs)
+    n_chunks = 4 * n_jobs if n_chunks is None else n_chunks
+    chunks = np.array_split(evidence, min(n_chunks, len(evidence)))
+
+    shapes = [potential.shape for potential in junction_tree.potentials]
+    shm = shared_memory.SharedMemory(create=True, size=max(8, 8 * sum(int(np.prod(shape)) for shape in shapes)))
+
+    try:
+        offset = 0
+        buffer = np.ndarray((shm.size // 8,), dtype=np.float64, buffer=shm.buf)
+        for potential in junction_tree.potentials:
+            buffer[offset:offset + potential.size] = potential.ravel()
+            offset += potential.size
+        del buffer
+
+        structure = copy.copy(junction_tree)
+        structure.potentials = None
+
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(structure, shm.name, shapes)) as executor:
+            results = list(executor.map(_marginals, chunks, [variables] * len(chunks), [max_memory] * len(chunks)))
+
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return [np.concatenate([result[k] for result in results]) for k in range(len(variables))]
@@ -1,145 +1,167 @@
 from .nodes import Node
-import pandas as pd
+from .sampling import topological_order
+import json
 import numpy as np
 import re
 
+BNZ_MAGIC = b'BNZ1'
+BNZ_VERSION = 1
+BNZ_ALIGNMENT = 64
+
 def _sub_id(value):
     return re.sub('[^a-z0-9_]', '', value.lower())[:20]
 
-def _reshape_npt(force_summation=False):
+def _reshape_npt(npt, shape, force_summation=False):
 
-    def get_npt(row):
-        npt = np.array(row['npt'])
-        npt = npt.squeeze() if (len(row['shape']) == 1) else npt.reshape(row['shape'])
-        
-        if force_summation:
-            npt = npt/npt.sum(axis=0)
+    # - Arrays (e.g. memory-mapped npts) are reshaped without copying
+    npt = np.asarray(npt)
+    npt = npt.squeeze() if (len(shape) == 1) else npt.reshape(shape)
 
-        return npt
+    if force_summation:
+        npt = npt/npt.sum(axis=0)
 
-    return get_npt
+    return npt
 
-def _check_npt(row):
-    f = np.abs(row['npt'].sum(axis=0) - 1) > 1e-10
+def _check_npt(idx, npt):
+    f = np.abs(npt.sum(axis=0) - 1) > 1e-10
     if any(f.flatten()):
-        raise ValueError(f"The probabilities for {row['id']} do not sum to 1. Please change or use force_summation=True when reading from file")
-
-def _get_npt_shape(df):
-    
-    def get_shape(row):
-        return [len(row['states']), *(len(df.loc[idx, 'states']) for idx in row['parents'])]
-    
-    return get_shape
-
-def get_variables(df, force_summation=False):
-
-    df = df.reset_index(drop=True)
-    
-    # - Number parents
-    df['parents'] = df['parents'].apply(lambda x: [df['id'].to_list().index(idx) for idx in x])
-
-    # - Get levels
-    current_level = 0
-    df['level'] = -1
-    df.loc[df['parents'].apply(lambda x: len(x)==0), 'level'] = current_level
-
-    # - get next level
-    while sum(df['level'] == -1) > 0:
-        current_level += 1
-        df.loc[df['level'] == -1, 'level'] = df.loc[df['level'] == -1, 'parents'].apply(
-            lambda parents: current_level if all(df.loc[parent, 'level'] >= 0 for parent in parents) else -1
+        raise ValueError(f"The probabilities for {idx} do not sum to 1. Please change or use force_summation=True when reading from file")
+
+def get_variables(records, force_summation=False, trusted=False):
+
+    """
+    Returns the Node of each record (a dict with keys id, name, states,
+    description, npt, group and a list of parent ids), in the same order.
+    Nodes are created in topological order so parents exist before their
+    children. Trusted npts (e.g. from a bnz file, checked when it was
+    written) are not checked again.
+    """
+
+    # - Index the first record with each id
+    index = {}
+    for i, record in enumerate(records):
+        index.setdefault(record['id'], i)
+
+    parents = []
+    for record in records:
+        for idx in record['parents']:
+            if idx not in index:
+                raise ValueError(f"The parent {idx} of {record['id']} does not match any variable")
+        parents.append([index[idx] for idx in record['parents']])
+
+    order = topological_order(parents)
+
+    # - Reshape and check npts
+    npts = []
+    for record, p in zip(records, parents):
+        shape = [len(record['states']), *(len(records[j]['states']) for j in p)]
+        npts.append(_reshape_npt(record['npt'], shape, force_summation=force_summation))
+
+    if not (force_summation or trusted):
+        for record, npt in zip(records, npts):
+            _check_npt(record['id'], npt)
+
+    variables = [None] * len(records)
+    for i in order:
+        record = records[i]
+        variables[i] = Node(
+            id=record['id'],
+            name=record['name'],
+            states=record['states'],
+            description=record['description'],
+            npt=npts[i],
+            group=record['group'],
+            parents=[variables[j] for j in parents[i]] or None,
+            trusted=trusted
         )
 
-    # - Reshape npts
-    df['shape'] = df[['states', 'parents']].apply(_get_npt_shape(df), axis=1)    
-    df['npt'] = df[['npt', 'shape']].apply(_reshape_npt(force_summation=force_summation), axis=1)
-    
-    # - Check npt values
-    if not force_summation:
-        df[['id', 'npt']].apply(_check_npt, axis=1)
+    return variables
+
+def _cmpx_description(description):
+    return None if (description in ['', 'New Node']) or (description != description) else description
+
+def list_networks(data):
+
+    """
+    Returns the index, id, name and number of nodes of each network in cmpx data
+    """
+
+    return [{
+        'index': i,
+        'id': network.get('id'),
+        'name': network.get('name'),
+        'n_nodes': len(network.get('nodes', []))
+    } for i, network in enumerate(data['model']['networks'])]
+
+def get_network(data, network):
+
+    """
+    Returns the data of a network in cmpx data from its index or name
+    """
+
+    networks = data['model']['networks']
 
-    # - Create column for variables
-    df['variable'] = None
+    if isinstance(network, str):
+        for network_data in networks:
+            if network_data.get('name') == network:
+                return network_data
 
-    prior_keys = ['id', 'name', 'states', 'description', 'npt', 'group']
-    other_keys = prior_keys + ['parents']
-    for level in range(0, current_level+1):
-        
-        
+        raise KeyError(f"The network '{network}' does not match any contained in the file")
 
-        recs = df['level']==level
-        if level==0:
-            df.loc[recs, 'variable'] = df.loc[recs, prior_keys].apply(lambda x: Node(**x), axis=1)
-        else:
-            df.loc[recs, 'parents'] = df.loc[recs, 'parents'].apply(lambda x: [df.loc[idx, 'variable'] for idx in x])            
-            df.loc[recs, 'variable'] = df.loc[recs, other_keys].apply(lambda x: Node(**x), axis=1)
+    if not -len(networks) <= network < len(networks):
+        raise IndexError(f'The network index {network} is out of range for a file of {len(networks)} network(s)')
 
-    return df['variable'].to_list()
+    return networks[network]
 
 def from_cmpx(data, network=0, remove_disconnected_variables=True, force_summation=False):
-    model_data = data['model']['networks'][network]
-    
+    model_data = get_network(data, network)
+
     # - Prepare variables
-    var_list = pd.json_normalize(model_data['nodes'])
-    var_list = var_list.rename(columns={
-        'configuration.states': 'states',
-        'configuration.table.probabilities': 'npt'
-    })
-
-    if 'description' not in var_list.columns:
-        var_list['description'] = None
-
-    if 'group' not in var_list.columns:
-        var_list['group'] = None
-
-    var_list.loc[var_list['description'].isin(['', 'New Node']), 'description'] = None    
-    var_list.loc[var_list['description'].isna(), 'description'] = None
-    
-    var_list = var_list[[ 'id', 'name','description' , 'npt', 'states', 'group']]
-
-    var_list['id'] = var_list['id'].apply(_sub_id)
-
-    # - prepare links to find parents
-    links = pd.json_normalize(model_data['links'])
-    
-    for col in ['child', 'parent']:
-        links[col] = links[col].apply(_sub_id)
-
-    var_list['parents'] = var_list['id'].apply(
-        lambda x: links.loc[links['child'] == x, 'parent'].to_list()
-    )
-    
-    var_list['children'] = var_list['id'].apply(
-        lambda x: links.loc[links['parent'] == x, 'child'].to_list()
-    )
+    records = [{
+        'id': _sub_id(node['id']),
+        'name': node['name'],
+        'description': _cmpx_description(node.get('description')),
+        'npt': node['configuration']['table']['probabilities'],
+        'states': node['configuration']['states'],
+        'group': node.get('group'),
+        'parents': []
+    } for node in model_data['nodes']]
+
+    # - Index links to find parents
+    index = {record['id']: record for record in records}
+    has_children = set()
+
+    for link in model_data.get('links', []):
+        parent, child = _sub_id(link['parent']), _sub_id(link['child'])
+        if child in index:
+            index[child]['parents'].append(parent)
+        has_children.add(parent)
 
     if remove_disconnected_variables:
-        disconnected_variables = var_list['parents'].apply(lambda x: len(x) == 0) & var_list['children'].apply(
-            lambda x: len(x) == 0)
-        var_list = var_list[~disconnected_variables]
+        records = [record for record in records if record['parents'] or (record['id'] in has_children)]
 
     data = {
         'id': re.sub('[^a-z0-9_]', '', model_data['name'].lower())[:20],
         'name': model_data['name'],
         'description': None if ('description' not in model_data.keys()) else model_data['description'],
-        'variables': get_variables(var_list, force_summation=force_summation)
+        'variables': get_variables(records, force_summation=force_summation)
     }
 
     return data
 
-def from_dict(data, force_summation=False):
-
-    var_list = pd.json_normalize(data['variables'])
-    
-    var_list['parents'] = var_list['parents'].apply(lambda x: [] if x is None else x)
-    
-    if 'description' not in var_list.columns:
-        var_list['description'] = None
+def from_dict(data, force_summation=False, trusted=False):
 
-    if 'group' not in var_list.columns:
-        var_list['group'] = None
+    records = [{
+        'id': variable['id'],
+        'name': variable['name'],
+        'states': variable['states'],
+        'description': variable.get('description'),
+        'npt': variable['npt'],
+        'group': variable.get('group'),
+        'parents': variable.get('parents') or []
+    } for variable in data['variables']]
 
-    data['variables'] = get_variables(var_list, force_summation=force_summation)
+    data['variables'] = get_variables(records, force_summation=force_summation, trusted=trusted)
 
     return data
 
@@ -191,3 +213,82 @@ def to_cmpx(model):
 
     return {'model': {'settings': settings, 'networks': [network]}}
 
+
+
+def to_bnz(model, filename):
+
+    """
+    Writes a model to the binary bnz format: the magic bytes, the length of
+    a JSON header holding to_dict without its arrays, then (aligned to 64
+    bytes) one contiguous float64 block holding every npt and count array.
+    Numbers are little-endian so files can be shared between machines.
+    """
+
+    data = model.to_dict()
+    arrays, offset = [], 0
+
+    def add(values):
+        nonlocal offset
+        values = np.ascontiguousarray(values, dtype='<f8')
+        arrays.append(values)
+        offset += values.size
+        return [offset - values.size, list(values.shape)]
+
+    for record, variable in zip(data['variables'], model.variables):
+        record['npt'] = add(variable.npt.values)
+
+    if 'counts' in data:
+        data['counts'] = {idx: add(counts) for idx, counts in model.counts.items()}
+
+    header = json.dumps({'version': BNZ_VERSION, 'size': offset, 'model': data}).encode('utf-8')
+    start = -(-(len(BNZ_MAGIC) + 8 + len(header)) // BNZ_ALIGNMENT) * BNZ_ALIGNMENT
+
+    with open(filename, 'wb') as file:
+        file.write(BNZ_MAGIC)
+        file.write(np.array(len(header), dtype='<u8').tobytes())
+        file.write(header)
+        file.write(b'\0' * (start - len(BNZ_MAGIC) - 8 - len(header)))
+        for values in arrays:
+            file.write(values.tobytes())
+
+def read_bnz(filename, mmap=True):
+
+    """
+    Returns the to_dict structure of a bnz file, with the npt and count
+    arrays as read-only views of the float block, memory-mapped unless mmap
+    is False
+    """
+
+    with open(filename, 'rb') as file:
+        if file.read(len(BNZ_MAGIC)) != BNZ_MAGIC:
+            raise ValueError(f'{filename} is not a bnz file')
+
+        length = int(np.frombuffer(file.read(8), dtype='<u8')[0])
+        header = json.loads(file.read(length).decode('utf-8'))
+
+    if header.get('version') != BNZ_VERSION:
+        raise ValueError(f"{filename} is bnz version {header.get('version')}, only version {BNZ_VERSION} can be read")
+
+    start = -(-(len(BNZ_MAGIC) + 8 + length) // BNZ_ALIGNMENT) * BNZ_ALIGNMENT
+
+    if header['size'] == 0:
+        block = np.empty(0)
+    elif mmap:
+        block = np.memmap(filename, dtype='<f8', mode='r', offset=start, shape=(header['size'],)).view(np.ndarray)
+    else:
+        block = np.fromfile(filename, dtype='<f8', count=header['size'], offset=start)
+        block.setflags(write=False)
+
+    def view(location):
+        offset, shape = location
+        return block[offset:offset + int(np.prod(shape))].reshape(shape)
+
+    data = header['model']
+
+    for record in data['variables']:
+        record['npt'] = view(record['npt'])
+
+    if 'counts' in data:
+        data['counts'] = {idx: view(location) for idx, location in data['counts'].items()}
+
+    return data
@@ -0,0 +1,100 @@
+import functools
+import time
+from contextlib import contextmanager, nullcontext
+
+# - Returned instead of a timer when profiling is disabled
+DISABLED = nullcontext()
+
+
+def timed(name):
+
+    """
+    Decorator recording a BayesianNetwork method as a phase when profiling is enabled
+    """
+
+    def decorator(method):
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.profiler is None:
+                return method(self, *args, **kwargs)
+
+            with self.profiler.phase(name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class Profiler:
+
+    """
+    Aggregated timings of the phases of BayesianNetwork calls (e.g. check,
+    compile_exact, encode, patterns, inference, assemble) and counters such
+    as the number of rows and distinct evidence patterns queried. Enabled
+    with BayesianNetwork.enable_profiling.
+
+    Kwargs:
+    callbacks [=None] (list) - functions called as callback(phase, elapsed) after every phase, e.g. to
+        forward timings to a metrics system
+    """
+
+    def __init__(self, callbacks=None):
+        self.callbacks = list(callbacks or [])
+        self.reset()
+
+    def reset(self):
+        self.__timings = {}
+        self.__counters = {}
+
+    @contextmanager
+    def phase(self, name):
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, elapsed):
+
+        timing = self.__timings.get(name)
+        if timing is None:
+            self.__timings[name] = [1, elapsed, elapsed]
+        else:
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] = max(timing[2], elapsed)
+
+        for callback in self.callbacks:
+            callback(name, elapsed)
+
+    def increment(self, name, value=1):
+        self.__counters[name] = self.__counters.get(name, 0) + value
+
+    @property
+    def timings(self):
+
+        """
+        Dictionary of the form {phase: {'count', 'total', 'mean', 'max'}} with times in seconds
+        """
+
+        return {
+            name: {'count': count, 'total': total, 'mean': total/count, 'max': maximum}
+            for name, (count, total, maximum) in self.__timings.items()
+        }
+
+    @property
+    def counters(self):
+        return dict(self.__counters)
+
+    def to_dict(self):
+        return {'timings': self.timings, 'counters': self.counters}
+
+    def to_df(self):
+        import pandas as pd
+        return pd.DataFrame.from_dict(self.timings, orient='index', columns=['count', 'total', 'mean', 'max'])
+
+    def __repr__(self):
+        return f'Profiler(phases={list(self.__timings)}, counters={self.__counters})'
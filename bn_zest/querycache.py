@@ -0,0 +1,85 @@
+import copy
+from collections import OrderedDict
+
+
+class QueryCache:
+
+    """
+    Bounded least recently used cache of query results, cleared by the
+    model whenever its structure or an npt changes
+
+    Kwargs:
+    maxsize [=1024] (int) - maximum number of results kept
+    """
+
+    def __init__(self, maxsize=1024):
+
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__results = OrderedDict()
+
+    @staticmethod
+    def key(X, outputs, **options):
+
+        """
+        Returns the canonical key of a dict of evidence (ignoring order and
+        None values), the ids of the requested outputs and query options. The
+        outputs are part of the key since a variable given as None is
+        returned by neither query with the same observed evidence.
+        """
+
+        return (
+            tuple(sorted((idx, state) for idx, state in X.items() if state is not None)),
+            tuple(outputs),
+            tuple(sorted(options.items()))
+        )
+
+    def get(self, key):
+
+        """
+        Returns a copy of the cached result, or None on a miss
+        """
+
+        result = self.__results.get(key)
+
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.__results.move_to_end(key)
+        return self._copy(result)
+
+    def set(self, key, result):
+
+        self.__results[key] = self._copy(result)
+        self.__results.move_to_end(key)
+
+        while len(self.__results) > self.maxsize:
+            self.__results.popitem(last=False)
+
+    @staticmethod
+    def _copy(result):
+
+        # - Results are copied in and out so callers cannot modify the cache,
+        # plain marginals ({id: [probs]}) are copied without deepcopy
+        if isinstance(result, dict):
+            return {idx: list(values) for idx, values in result.items()}
+
+        return copy.deepcopy(result)
+
+    def clear(self):
+        self.__results.clear()
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.__results), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self.__results)
+
+    def __repr__(self):
+        return f'QueryCache(hits={self.hits}, misses={self.misses}, size={len(self)}, maxsize={self.maxsize})'
@@ -0,0 +1,191 @@
+import numpy as np
+
+
+def topological_order(parents):
+
+    """
+    Returns the variable indices ordered so that parents precede their children (Kahn's algorithm)
+    """
+
+    n_parents = [len(p) for p in parents]
+    children = [[] for _ in parents]
+    for i, p in enumerate(parents):
+        for j in p:
+            children[j].append(i)
+
+    order = [i for i, k in enumerate(n_parents) if k == 0]
+    for i in order:
+        for j in children[i]:
+            n_parents[j] -= 1
+            if n_parents[j] == 0:
+                order.append(j)
+
+    if len(order) < len(parents):
+        raise ValueError('The network contains a cycle')
+
+    return order
+
+
+def code_dtype(cardinalities):
+    return np.int8 if max(cardinalities, default=0) <= 127 else np.int32
+
+
+class ForwardSampler:
+
+    """
+    Ancestral sampling over the npt arrays, drawing a whole column per
+    variable in topological order.
+
+    Args:
+    cardinalities (list) - number of states of each variable
+    parents (list) - list of parent indices of each variable
+    tables (list) - npt arrays of shape (n_states, *parent sizes)
+    """
+
+    def __init__(self, cardinalities, parents, tables):
+
+        self.cardinalities = list(cardinalities)
+        self.parents = [list(p) for p in parents]
+        self.order = topological_order(self.parents)
+        self.dtype = code_dtype(self.cardinalities)
+
+        # - Tables of shape (n_parent_configurations, n_states) and their cumulative sums
+        self.tables = [
+            np.moveaxis(np.asarray(table, dtype=float), 0, -1).reshape(-1, k)
+            for table, k in zip(tables, self.cardinalities)
+        ]
+
+        # - Normalised cumulative sums offset by their row, flattened so a single
+        # searchsorted draws every row whatever its parent configuration
+        self.cdfs = []
+        for table in self.tables:
+            cdf = np.cumsum(table, axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                cdf = cdf/cdf[:, -1:]
+            self.cdfs.append((cdf + np.arange(len(cdf))[:, None]).ravel())
+
+    def configurations(self, i, codes):
+
+        """
+        Returns the row of the table of variable i for each row of codes
+        """
+
+        if not self.parents[i]:
+            return np.zeros(len(codes), dtype=np.intp)
+
+        return np.ravel_multi_index(
+            tuple(codes[:, j].astype(np.intp) for j in self.parents[i]),
+            [self.cardinalities[j] for j in self.parents[i]]
+        )
+
+    def _draw(self, i, configurations, rng):
+        k = self.cardinalities[i]
+        index = np.searchsorted(self.cdfs[i], configurations + rng.random(len(configurations)), side='right')
+        return np.minimum(index - configurations * k, k - 1)
+
+    def sample(self, n, rng):
+
+        """
+        Returns an integer array of shape (n, n_variables) of sampled state codes
+        """
+
+        codes = np.empty((n, len(self.cardinalities)), dtype=self.dtype, order='F')
+
+        for i in self.order:
+            codes[:, i] = self._draw(i, self.configurations(i, codes), rng)
+
+        return codes
+
+    def chunks(self, n, chunk_size, rng):
+
+        """
+        Yields arrays of sampled state codes of at most chunk_size rows, n rows in total
+        """
+
+        for start in range(0, n, chunk_size):
+            yield self.sample(min(chunk_size, n - start), rng)
+
+    def likelihood_weighting(self, evidence, variables, n_samples, rng, max_memory=2**28):
+
+        """
+        Estimates posterior marginals by likelihood weighting: evidence
+        variables are clamped and each sample is weighted by the probability
+        of the evidence given its sampled parents. All evidence rows are
+        sampled together, in batches of rows whose samples take at most
+        max_memory bytes (a single row is never split).
+
+        Args:
+        evidence (ndarray) - integer array of shape (n_rows, n_variables) of observed state codes, -1 for missing
+        variables (list) - indices of the variables to estimate
+        n_samples (int) - number of samples per evidence row
+        rng (Generator) - numpy random generator
+
+        Kwargs:
+        max_memory [=2**28] (int) - bytes of samples held at once
+
+        Returns:
+        marginals (list) - arrays of shape (n_rows, n_states) for each variable, nan where every weight is zero
+        ess (ndarray) - effective sample size of each row
+        stderr (list) - standard errors of the marginals
+        """
+
+        evidence = np.atleast_2d(np.asarray(evidence))
+        n_rows = len(evidence)
+
+        # - Each sample holds a code per variable plus its row, weight and
+        # parent configuration (8 bytes each) while the batch is processed
+        sample_size = len(self.cardinalities) * np.dtype(self.dtype).itemsize + 32
+        batch = max(1, max_memory // (n_samples * sample_size))
+
+        marginals = [np.empty((n_rows, self.cardinalities[v])) for v in variables]
+        stderr = [np.empty((n_rows, self.cardinalities[v])) for v in variables]
+        ess = np.empty(n_rows)
+
+        for start in range(0, n_rows, batch):
+            rows = evidence[start:start + batch]
+            n = len(rows) * n_samples
+            row = np.repeat(np.arange(len(rows)), n_samples)
+
+            codes = np.empty((n, len(self.cardinalities)), dtype=self.dtype, order='F')
+            log_weights = np.zeros(n)
+
+            for i in self.order:
+                configurations = self.configurations(i, codes)
+                observed = rows[row, i]
+                clamped = observed >= 0
+
+                codes[:, i] = np.where(clamped, observed, 0)
+                if clamped.any():
+                    table = self.tables[i]
+                    with np.errstate(divide='ignore'):
+                        log_weights[clamped] += np.log(table[configurations[clamped], observed[clamped]])
+
+                if not clamped.all():
+                    free = ~clamped
+                    codes[free, i] = self._draw(i, configurations[free], rng)
+
+            # - Scale weights within each evidence row for numerical stability
+            log_weights = log_weights.reshape(len(rows), n_samples)
+            with np.errstate(invalid='ignore'):
+                log_weights -= log_weights.max(axis=1, keepdims=True)
+            weights = np.nan_to_num(np.exp(log_weights)).ravel()
+
+            total = np.bincount(row, weights, minlength=len(rows))
+            total_sq = np.bincount(row, weights**2, minlength=len(rows))
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ess[start:start + len(rows)] = total**2/total_sq
+
+                for m, v in enumerate(variables):
+                    k = self.cardinalities[v]
+                    index = row * k + codes[:, v]
+                    p = np.bincount(index, weights, minlength=len(rows) * k).reshape(-1, k)/total[:, None]
+                    w_sq = np.bincount(index, weights**2, minlength=len(rows) * k).reshape(-1, k)
+
+                    # - Delta method variance of the self-normalised estimator
+                    variance = (w_sq * (1 - 2 * p) + p**2 * total_sq[:, None])/total[:, None]**2
+
+                    marginals[m][start:start + len(rows)] = p
+                    stderr[m][start:start + len(rows)] = np.sqrt(np.maximum(variance, 0))
+
+        return marginals, ess, stderr
@@ -0,0 +1,153 @@
+import numpy as np
+
+
+class InferenceSession:
+
+    """
+    Exact inference session over a BayesianNetwork for repeated queries with
+    changing evidence. Junction tree messages are cached between queries and
+    changing the evidence of a variable only invalidates the messages
+    flowing away from the clique holding it, so marginals() recomputes the
+    minimum required.
+
+    Args:
+    model (BayesianNetwork) - the model to query
+
+    Kwargs:
+    X [=None] (dict) - initial evidence
+    """
+
+    def __init__(self, model, X=None):
+
+        self.model = model
+        self.__evidence = {}
+        self.__junction_tree = None
+        self.__potentials = None
+        self.__likelihoods = {}
+        self.__messages = {}
+        self.__beliefs = {}
+
+        if X is not None:
+            self.set_evidence(X)
+
+    @property
+    def evidence(self):
+        return dict(self.__evidence)
+
+    def _invalidate(self, idx):
+
+        """
+        Drops the cached messages pointing away from the clique holding idx
+        and the beliefs of its component
+        """
+
+        if self.__junction_tree is None:
+            return
+
+        v = self.model.variable_index[idx]
+        root = self.__junction_tree.home[v]
+
+        for i, j in self.__junction_tree.outward(root):
+            self.__messages.pop((i, j), None)
+            self.__beliefs.pop(j, None)
+
+        self.__beliefs.pop(root, None)
+        self.__likelihoods.pop(v, None)
+
+    def set_evidence(self, X):
+
+        """
+        Sets the states of the variables in X, a value of None retracts the evidence
+        """
+
+        for idx, state in X.items():
+            if idx not in self.model.variable_index:
+                raise KeyError(f'The node {idx} does not match any contained in the model')
+
+            if (state is not None) and (state not in self.model[idx].state_index):
+                raise ValueError(f"The state '{state}' is not a state of {idx}")
+
+        for idx, state in X.items():
+            if state is None:
+                self.retract_evidence(idx)
+            elif self.__evidence.get(idx) != state:
+                self.__evidence[idx] = state
+                self._invalidate(idx)
+
+        return self
+
+    def retract_evidence(self, *ids):
+
+        """
+        Removes the evidence of the given variables, or all evidence if none are given
+        """
+
+        for idx in (ids or list(self.__evidence.keys())):
+            if idx in self.__evidence:
+                del self.__evidence[idx]
+                self._invalidate(idx)
+
+        return self
+
+    def _check_junction_tree(self):
+
+        junction_tree = self.model._get_junction_tree()
+
+        # - A recompiled model has new potentials so nothing cached is valid
+        if (junction_tree is not self.__junction_tree) or (junction_tree.potentials is not self.__potentials):
+            self.__junction_tree = junction_tree
+            self.__potentials = junction_tree.potentials
+            self.__likelihoods, self.__messages, self.__beliefs = {}, {}, {}
+
+        for idx, state in self.__evidence.items():
+            v = self.model.variable_index[idx]
+            if v not in self.__likelihoods:
+                likelihood = np.zeros((1, len(self.model[idx])))
+                likelihood[0, self.model[idx].state_index[state]] = 1
+                self.__likelihoods[v] = likelihood
+
+        return junction_tree
+
+    def marginals(self, variables=None):
+
+        """
+        Returns the marginal probabilities given the current evidence
+
+        Kwargs:
+        variables [=None] (list) - ids of the variables to return, defaults to all variables without evidence
+
+        Returns:
+        dict of the form {variable_id: [probs]}
+        """
+
+        if variables is None:
+            variables = [idx for idx in self.model.variable_ids if idx not in self.__evidence]
+
+        for idx in variables:
+            if idx not in self.model.variable_index:
+                raise KeyError(f'The node {idx} does not match any contained in the model')
+
+        junction_tree = self._check_junction_tree()
+        likelihoods, messages, beliefs = self.__likelihoods, self.__messages, self.__beliefs
+
+        output = {}
+        for idx in variables:
+            v = self.model.variable_index[idx]
+            i = junction_tree.home[v]
+
+            if i not in beliefs:
+                for a, b in reversed(junction_tree.outward(i)):
+                    if (b, a) not in messages:
+                        messages[(b, a)] = junction_tree._message(b, a, likelihoods, messages, 1)
+
+                beliefs[i] = junction_tree._belief(i, likelihoods, messages, 1)
+
+            output[idx] = junction_tree._marginal(beliefs[i], i, v)[0].tolist()
+
+        if any(np.isnan(values).any() for values in output.values()):
+            raise ValueError('The evidence supplied has zero probability')
+
+        return output
+
+    def __repr__(self):
+        return f'InferenceSession({self.model.name}, evidence={self.__evidence})'
@@ -0,0 +1,51 @@
+import numpy as np
+from .nodes import Node
+from .models import BayesianNetwork
+
+
+def random_network(n_nodes, n_states=2, max_in_degree=2, treewidth=None, seed=None, name='Synthetic network'):
+
+    """
+    Returns a random BayesianNetwork for testing and benchmarking. Nodes are
+    added in order and each takes up to max_in_degree parents from the
+    preceding nodes, with random npts.
+
+    Args:
+    n_nodes (int) - number of nodes
+
+    Kwargs:
+    n_states [=2] (int, tuple) - number of states of every node, or a (min, max) range to draw from
+    max_in_degree [=2] (int) - maximum number of parents of a node
+    treewidth [=None] (int) - parents are only drawn from the preceding treewidth nodes, which bounds the
+        bandwidth and so the treewidth of the moral graph, defaults to unbounded
+    seed [=None] (int, Generator) - seed or numpy Generator
+    name [='Synthetic network'] (str) - name of the network
+    """
+
+    rng = np.random.default_rng(seed)
+
+    if treewidth is not None:
+        if treewidth < 1:
+            raise ValueError('treewidth must be at least 1')
+        max_in_degree = min(max_in_degree, treewidth)
+
+    low, high = (n_states, n_states) if isinstance(n_states, int) else n_states
+
+    variables = []
+    for i in range(n_nodes):
+        start = 0 if (treewidth is None) else max(0, i - treewidth)
+        n_parents = rng.integers(0, min(max_in_degree, i - start) + 1)
+        parents = [variables[j] for j in sorted(rng.choice(np.arange(start, i), size=n_parents, replace=False))]
+
+        k = int(rng.integers(low, high + 1))
+        npt = rng.random([k, *(len(parent) for parent in parents)])
+
+        variables.append(Node(
+            f'N{i}',
+            id=f'n{i}',
+            states=[f's{j}' for j in range(k)],
+            parents=parents or None,
+            npt=npt/npt.sum(axis=0)
+        ))
+
+    return BayesianNetwork(name, variables=variables)
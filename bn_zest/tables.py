@@ -2,29 +2,53 @@ import pandas as pd
 import numpy as np
 from pomegranate import DiscreteDistribution
 from pomegranate import ConditionalProbabilityTable as BaseCPT
-import itertools
 
-pd.set_option('expand_frame_repr', False)
+
+def _to_string(df):
+
+    # - Wide tables are printed on one line without changing the global pandas options
+    with pd.option_context('display.expand_frame_repr', False):
+        return str(df.round(3))
 
 
 class PriorProbabilityTable(DiscreteDistribution):
 
-    def __new__(cls, label, states, values):
-        cls._check_values(label, states, values)
+    # - Priors are always built eagerly (see ConditionalProbabilityTable)
+    _deferred = False
+
+    def __new__(cls, label, states, values, trusted=False):
+        if not trusted:
+            cls._check_values(label, states, values)
         return super(PriorProbabilityTable, cls).__new__(cls, dict(zip(states, values)))
 
-    def __init__(self, label, states, values):
+    def __init__(self, label, states, values, trusted=False):
         self.label = label
         self.states = states
+        self._values = self._to_array(values)
 
     @property
     def values(self):
-        return self.parameters[0].values()
+        return self._values
 
     @values.setter
     def values(self, values):
         self._check_values(self.label, self.states, values)
-        self.parameters = [dict(zip(self.states, values))]
+        self._values = self._to_array(values)
+        self.parameters = [dict(zip(self.states, self._values.tolist()))]
+
+    @staticmethod
+    def _to_array(values):
+        values = np.array(values, dtype=np.float64)
+        values.setflags(write=False)
+        return values
+
+    def _refresh_values(self):
+
+        """
+        Re-reads the values after pomegranate has updated its parameters in place (e.g. fit)
+        """
+
+        self._values = self._to_array([self.parameters[0][state] for state in self.states])
 
     @staticmethod
     def _check_values(label, states, values):
@@ -48,47 +72,82 @@ class PriorProbabilityTable(DiscreteDistribution):
         return self.__class__(**self.get_params())
 
     def __repr__(self):
-        return str(self.to_df().round(3))
+        return _to_string(self.to_df())
 
     def __str__(self):
-        return str(self.to_df().round(3))
+        return _to_string(self.to_df())
 
 
 class ConditionalProbabilityTable(BaseCPT):
 
-    def __init__(self, label, states, parent_nodes, values):
+    def __init__(self, label, states, parent_nodes, values, trusted=False):
         self.label = label
         self.states = states
         self.parent_nodes = parent_nodes
         self.npt_shape = [len(states)] + [len(node) for node in self.parent_nodes]
 
-        if isinstance(values, list):
-            values = np.array(values)
+        values = np.asarray(values, dtype=np.float64)
 
-        self._check_values(values)
-        params = self._values_to_parameters(values)
-        super().__init__(params, [p.distribution for p in self.parent_nodes])
+        # - Trusted values (e.g. read back from a bnz file) are not checked again
+        if not trusted:
+            self._check_values(values)
+
+        # - The pomegranate table is only built when the model is compiled for
+        # the pomegranate engine, the other engines only use the array
+        self._values = self._to_array(values)
+        self._deferred = True
+
+    def _build(self):
+
+        """
+        Builds the pomegranate table from the values, deferred until the model
+        is compiled for the pomegranate engine
+        """
+
+        super().__init__(self._values_to_parameters(), [p.distribution for p in self.parent_nodes])
+        self._deferred = False
 
     def parent_labels(self):
-        return [parent.label for parent in self.parents]
+        return [parent.name for parent in self.parent_nodes]
 
     def state_list(self):
         return [parent.states for parent in self.parent_nodes] + [self.states]
 
     @property
     def values(self):
-        params = np.array(self.parameters[0])[:, -1]
-        shape = [len(parent) for parent in self.parents] + [len(self)]
-        params = params.astype(float).reshape(shape)
-        return np.moveaxis(params, -1, 0)
+        return self._values
 
     @values.setter
     def values(self, values):
 
-        if isinstance(values, list):
-            values = np.array(values)
+        values = np.asarray(values, dtype=np.float64)
+
+        self._check_values(values)
+        self._values = self._to_array(values)
 
-        self.parameters[0] = self._values_to_parameters(values)
+        if not self._deferred:
+            self.parameters[0] = self._values_to_parameters()
+
+    @staticmethod
+    def _to_array(values):
+
+        # - Read-only so the table cannot drift from the pomegranate parameters,
+        # views of memory-mapped or shared arrays are kept without copying
+        if values.flags['C_CONTIGUOUS'] and not values.flags['WRITEABLE']:
+            return values
+
+        values = np.array(values, dtype=np.float64, order='C')
+        values.setflags(write=False)
+        return values
+
+    def _refresh_values(self):
+
+        """
+        Re-reads the values after pomegranate has updated its parameters in place (e.g. fit)
+        """
+
+        params = np.array([row[-1] for row in self.parameters[0]], dtype=np.float64)
+        self._values = self._to_array(np.moveaxis(params.reshape(self.npt_shape[1:] + self.npt_shape[:1]), -1, 0))
 
     def _check_values(self, values):
 
@@ -99,10 +158,19 @@ class ConditionalProbabilityTable(BaseCPT):
         if any(f.flatten()):
             raise ValueError(f"The probabilities for '{self.label}' do not sum to 1")
 
-    def _values_to_parameters(self, values):
-        values = np.moveaxis(values, 0, -1).flatten()
-        state_combs = list(itertools.product(*self.state_list()))
-        return [list(states) + [float(value)] for states, value in zip(state_combs, values)]
+    def _values_to_parameters(self):
+
+        """
+        Returns the table as pomegranate parameter rows [parent states..., state, probability]
+        """
+
+        shape = self.npt_shape[1:] + self.npt_shape[:1]
+        index = np.indices(shape).reshape(len(shape), -1)
+
+        columns = [np.array(states, dtype=object)[idx] for states, idx in zip(self.state_list(), index)]
+        columns.append(np.moveaxis(self._values, 0, -1).ravel().astype(object))
+
+        return np.column_stack(columns).tolist()
 
     def to_df(self):
 
@@ -120,10 +188,16 @@ class ConditionalProbabilityTable(BaseCPT):
         }
 
     def copy(self):
-        return self.__class__(**self.get_params())
+
+        # - pomegranate copies the tables of a model as it compiles, so built tables stay built
+        table = self.__class__(**self.get_params(), trusted=True)
+        if not self._deferred:
+            table._build()
+
+        return table
 
     def __repr__(self):
-        return str(self.to_df().round(3))
+        return _to_string(self.to_df())
 
     def __str__(self):
-        return str(self.to_df().round(3))
+        return _to_string(self.to_df())
@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+import unittest
+from . import base
+from bn_zest import ModelCache
+
+
+class TestModelCache(base.ErrorTestMixin, unittest.TestCase):
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ModelCache(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_cache_hit(self):
+
+        filename = os.path.join(base.MODELS_DIR, 'bendi_bn_test.cmpx')
+        model = self.load_model('bendi_bn_test.cmpx')
+
+        for _ in range(2):
+            cached = self.cache.load(filename)
+            self.assertEqual(json.dumps(cached.to_dict()), json.dumps(model.to_dict()))
+
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        # - Hits load the stored npts as trusted, leaving the pomegranate tables to be built on first use
+        self.assertTrue(cached.variables[-1].npt._deferred)
+        self.assertDictEqual(cached.predict_proba(engine='exact'), model.predict_proba(engine='exact'))
+
+        # - Different options are cached separately
+        self.cache.load(os.path.join(base.MODELS_DIR, 'limbmodel_test.cmpx'), force_summation=True)
+        self.cache.load(filename, remove_disconnected_variables=False)
+
+        self.assertEqual(self.cache.misses, 3)
+        self.assertEqual(len(self.cache.entries()), 3)
+
+    def test_cache_eviction(self):
+
+        self.cache.load(os.path.join(base.MODELS_DIR, 'test_output_model.json'))
+        self.cache.max_size = self.cache.size()
+
+        self.cache.load(os.path.join(base.MODELS_DIR, 'bendi_bn_test.cmpx'))
+        self.assertLessEqual(self.cache.size(), self.cache.max_size)
+        self.assertEqual(len(self.cache.entries()), 0)
+
+        self.cache.max_size = 2**30
+        self.cache.load(os.path.join(base.MODELS_DIR, 'test_output_model.json'))
+        self.cache.clear()
+        self.assertEqual(self.cache.size(), 0)
+
+    def test_cache_format_fail(self):
+        self.assertRaisesWithMessage(ValueError, self.cache.load, 'Only cmpx and json files can be cached', 'model.bnz')
+
+
+if __name__ == '__main__':
+    unittest.main()
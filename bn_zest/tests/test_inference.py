@@ -0,0 +1,218 @@
+import itertools
+import unittest
+import numpy as np
+import pandas as pd
+from . import base
+from bn_zest.inference import relevant_factors
+
+
+def brute_force_proba(model, inputs):
+
+    variables = model.variables
+    index = {variable.id: i for i, variable in enumerate(variables)}
+
+    joint = np.zeros([len(variable) for variable in variables])
+    for states in itertools.product(*[range(len(variable)) for variable in variables]):
+        p = 1
+        for i, variable in enumerate(variables):
+            key = (states[i],) + tuple(states[index[parent.id]] for parent in (variable.parents or []))
+            p *= variable.npt.values[key]
+        joint[states] = p
+
+    for idx, state in inputs.items():
+        mask = np.zeros(len(model[idx]))
+        mask[model[idx].states.index(state)] = 1
+        shape = [1] * len(variables)
+        shape[index[idx]] = -1
+        joint = joint * mask.reshape(shape)
+
+    return {
+        variable.id: (joint.sum(axis=tuple(j for j in range(len(variables)) if j != i))/joint.sum()).tolist()
+        for i, variable in enumerate(variables) if variable.id not in inputs
+    }
+
+
+class TestExactInference(base.ErrorTestMixin, unittest.TestCase):
+
+    def setUp(self):
+
+        self.model = base.create_test_model()
+
+    def test_exact_prediction(self):
+
+        for inputs in [{}, {'a': 'No', 'c': 'Positive', 'd': 'Red'}, {'f': 'Red', 'a': 'Yes'}]:
+            probs = self.model.predict_proba(X=inputs, engine='exact')
+            expected = brute_force_proba(self.model, inputs)
+
+            self.assertListEqual(list(probs.keys()), list(expected.keys()))
+            for idx, values in probs.items():
+                self.assertListAlmostEqual(values, expected[idx], places=10)
+
+    def test_exact_DataFrame_prediction(self):
+
+        X = pd.DataFrame({'a': ['No', 'Yes', None, 'No'], 'f': ['Red', None, 'Blue', 'Red']}, dtype=object)
+        probs = self.model.predict_proba(X, engine='exact')
+
+        for i, row in enumerate(X.to_dict('records')):
+            expected = brute_force_proba(self.model, {key: value for key, value in row.items() if value is not None})
+            for idx in probs.columns:
+                self.assertListAlmostEqual(probs.loc[i, idx], expected[idx], places=10)
+
+    def test_parallel_DataFrame_prediction(self):
+
+        X = pd.DataFrame({
+            'a': ['No', 'Yes', None, 'No'] * 5,
+            'd': ['Red', 'Green', 'Blue', None, 'Green'] * 4
+        }, dtype=object)
+
+        probs = self.model.predict_proba(X, engine='exact')
+        parallel_probs = self.model.predict_proba(X, engine='exact', n_jobs=2)
+
+        self.assertTrue(probs.equals(parallel_probs))
+
+        # - No rows gives the same empty frame as a single process
+        empty = X.iloc[:0]
+        self.assertTrue(self.model.predict_proba(empty, engine='exact', n_jobs=2).equals(self.model.predict_proba(empty, engine='exact')))
+
+    def test_array_prediction(self):
+
+        X = pd.DataFrame({'a': ['No', 'Yes', None], 'f': ['Red', None, 'Blue']}, dtype=object)
+        probs = self.model.predict_proba(X, engine='exact')
+
+        codes = np.array([[0, 0], [1, -1], [-1, 2]])
+        array_probs, columns = self.model.predict_proba_array(codes, columns=['a', 'f'], engine='exact')
+
+        self.assertEqual(array_probs.shape, (3, 10))
+        self.assertListEqual(list(columns.get_level_values('variable').unique()), ['b', 'c', 'd', 'e'])
+
+        for idx in probs.columns:
+            self.assertListAlmostEqual(array_probs[:, columns.get_loc(idx)].tolist(), probs[idx].tolist(), places=10)
+
+        categorical = pd.DataFrame({
+            'a': pd.Categorical.from_codes(codes[:, 0], categories=['No', 'Yes']),
+            'f': pd.Categorical.from_codes(codes[:, 1], categories=['Red', 'Green', 'Blue'])
+        })
+        self.assertTrue(np.array_equal(self.model.predict_proba_array(categorical, engine='exact')[0], array_probs))
+
+    def test_exact_predict(self):
+
+        X = pd.DataFrame({'a': ['No', 'Yes', None], 'f': ['Red', None, 'Blue']}, dtype=object)
+        probs = self.model.predict_proba(X, engine='exact')
+        predictions = self.model.predict(X, engine='exact')
+
+        for idx in probs.columns:
+            self.assertIsInstance(predictions[idx].dtype, pd.CategoricalDtype)
+            self.assertListEqual(list(predictions[idx].cat.categories), self.model[idx].states)
+            self.assertListEqual(
+                predictions[idx].tolist(),
+                [self.model[idx].states[np.argmax(values)] for values in probs[idx]]
+            )
+
+    def test_likelihood_weighting(self):
+
+        inputs = {'f': 'Red', 'a': 'Yes'}
+        probs, stats = self.model.predict_proba(inputs, engine='lw', n_samples=50000, random_state=0, return_stats=True)
+        expected = brute_force_proba(self.model, inputs)
+
+        self.assertGreater(stats['ess'], 40000)
+        for idx, values in expected.items():
+            for value, estimate, stderr in zip(values, probs[idx], stats['stderr'][idx]):
+                self.assertLess(abs(value - estimate), 5 * stderr)
+
+        # - A memory limit below one row's samples falls back to a row per batch
+        X = pd.DataFrame([inputs, {'f': 'Red'}, inputs], dtype=object)
+        probs, stats = self.model.predict_proba(X, engine='lw', n_samples=50000, random_state=0, return_stats=True, max_memory=1)
+
+        for i, row in enumerate([inputs, {'f': 'Red'}, inputs]):
+            expected = brute_force_proba(self.model, row)
+            for idx in probs.columns:
+                for value, estimate, stderr in zip(expected[idx], probs[idx][i], stats['stderr'][idx][i]):
+                    self.assertLess(abs(value - estimate), 5 * stderr)
+
+    def test_session_evidence_updates(self):
+
+        session = self.model.session({'a': 'No'})
+        steps = [
+            ({'f': 'Red'}, {'a': 'No', 'f': 'Red'}),
+            ({'a': 'Yes', 'd': 'Blue'}, {'a': 'Yes', 'f': 'Red', 'd': 'Blue'}),
+            ({'f': None}, {'a': 'Yes', 'd': 'Blue'}),
+        ]
+
+        for update, inputs in steps:
+            probs = session.set_evidence(update).marginals()
+            expected = brute_force_proba(self.model, inputs)
+            for idx, values in expected.items():
+                self.assertListAlmostEqual(probs[idx], values, places=10)
+
+        session.retract_evidence()
+        self.assertDictEqual(session.evidence, {})
+        self.assertListAlmostEqual(session.marginals(['b'])['b'], [0.6, 0.15, 0.25], places=10)
+
+    def test_target_prediction(self):
+
+        for inputs, targets in [({}, ['b']), ({'c': 'Positive'}, ['f', 'a']), ({'e': 'Up', 'a': 'No'}, ['d', 'b'])]:
+            probs = self.model.predict_proba(X=inputs, engine='exact', targets=targets)
+            expected = brute_force_proba(self.model, inputs)
+
+            self.assertListEqual(list(probs.keys()), targets)
+            for idx, values in probs.items():
+                self.assertListAlmostEqual(values, expected[idx], places=10)
+
+        X = pd.DataFrame({'c': ['Positive', None, 'Negative'], 'e': ['Up', 'Down', None]}, dtype=object)
+        probs = self.model.predict_proba(X, engine='exact', targets=['f', 'a'])
+        expected = self.model.predict_proba(X, engine='exact')[['f', 'a']]
+
+        for idx in ['f', 'a']:
+            self.assertListAlmostEqual(probs[idx].tolist(), expected[idx].tolist(), places=10)
+
+        self.assertRaisesWithMessage(ValueError, self.model.predict_proba, 'The target c is also an input', {'c': 'Positive'}, targets=['c'])
+
+        # - A target given as None is not observed
+        probs = self.model.predict_proba({'c': None, 'a': 'No'}, engine='exact', targets=['c'])
+        self.assertListAlmostEqual(probs['c'], brute_force_proba(self.model, {'a': 'No'})['c'], places=10)
+
+    def test_batched_marginals(self):
+
+        X = pd.DataFrame({'c': ['Positive', None, 'Negative', None, 'Positive'], 'e': ['Up', 'Down', None, 'Up', None]}, dtype=object)
+
+        # - Two rows per batch of the full tree
+        junction_tree = self.model._get_junction_tree()
+        evidence = np.full((len(X), len(self.model)), -1)
+        evidence[:, [2, 4]] = self.model._encode_DataFrame(X)
+
+        batched = junction_tree.marginals(evidence, [0, 5], max_memory=2 * junction_tree.row_size)
+        for values, expected in zip(batched, junction_tree.marginals(evidence, [0, 5])):
+            self.assertListAlmostEqual(values.ravel().tolist(), expected.ravel().tolist(), places=12)
+
+        # - A row per batch of the full and pruned trees
+        for targets in [None, ['f', 'a']]:
+            probs = self.model.predict_proba(X, engine='exact', targets=targets, max_memory=1)
+            expected = self.model.predict_proba(X, engine='exact', targets=targets)
+            for idx in expected.columns:
+                for values, expected_values in zip(probs[idx], expected[idx]):
+                    self.assertListAlmostEqual(values, expected_values, places=12)
+
+        self.assertTrue(self.model.predict(X, engine='exact', max_memory=1).equals(self.model.predict(X, engine='exact')))
+
+    def test_relevant_factors(self):
+
+        families = self.model._families()
+
+        # - Descendants are barren without evidence and observing c separates a and b from d, e and f
+        self.assertListEqual(relevant_factors(families, [1], [], []), [1])
+        self.assertListEqual(relevant_factors(families, [5], [2], [2]), [3, 4, 5])
+        self.assertListEqual(relevant_factors(families, [0], [3], [3]), [0, 1, 2, 3])
+        self.assertListEqual(relevant_factors(families, [0], [2, 5], [2, 5]), [0, 1, 2])
+        self.assertListEqual(relevant_factors(families, [5], [2], []), [0, 1, 2, 3, 4, 5])
+
+    def test_unknown_engine(self):
+        self.assertRaisesWithMessage(
+            ValueError,
+            self.model.predict_proba,
+            "The engine 'gibbs' is not recognised, use one of ['pomegranate', 'exact', 'lw']",
+            {}, engine='gibbs'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
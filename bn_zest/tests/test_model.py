@@ -1,4 +1,11 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+import numpy as np
+import pandas as pd
 from . import base
 from bn_zest import BayesianNetwork, Node
 
@@ -22,6 +29,14 @@ class TestModel(base.ErrorTestMixin, unittest.TestCase):
         for idx in self.model.variable_ids:
             self.assertIsInstance(self.model[idx], Node)
 
+    def test_variable_index(self):
+        self.assertDictEqual(dict(self.model.variable_index), {'a': 0, 'b': 1, 'c': 2, 'd': 3, 'e': 4, 'f': 5})
+        self.assertRaisesWithMessage(KeyError, self.model.__getitem__, "'The node g does not match any contained in the model'", 'g')
+
+        # - The index cannot be changed from outside the model
+        with self.assertRaises(TypeError):
+            self.model.variable_index['g'] = 6
+
     def test_model_prediction(self):
         inputs = {
             'a': 'No',
@@ -40,5 +55,313 @@ class TestModel(base.ErrorTestMixin, unittest.TestCase):
         for idx, values in probs.items():            
             self.assertListAlmostEqual(values, outputs[idx], places=6)
 
+    def test_DataFrame_invalid_states(self):
+
+        X = pd.DataFrame({'a': ['No', 'Maybe', None, 'Maybe'], 'f': ['Red', 'Red', 'Pink', 'Red']}, dtype=object)
+
+        self.assertRaisesWithMessage(
+            ValueError,
+            self.model.predict_proba,
+            "Invalid states found: 'Maybe' in 2 row(s) [1, 3] of a; 'Pink' in 1 row(s) [2] of f",
+            X
+        )
+
+    def test_DataFrame_numeric_states(self):
+
+        a = Node('A', states=['1', '2', '3'])
+        b = Node('B', states='YN', parents=[a], npt=[[0.9, 0.5, 0.1], [0.1, 0.5, 0.9]])
+        model = BayesianNetwork('Numeric states', variables=[a, b])
+
+        # - An int64 column (e.g. from read_csv) holds values, not state codes
+        self.assertRaisesWithMessage(
+            ValueError,
+            model.predict_proba,
+            "Invalid states found: '1', '2' in 2 row(s) [0, 1] of a",
+            pd.DataFrame({'a': [1, 2]}), engine='exact'
+        )
+
+        probs = model.predict_proba(pd.DataFrame({'a': ['1', '3']}), engine='exact')
+        self.assertListAlmostEqual(probs['b'].tolist(), [[0.9, 0.1], [0.1, 0.9]], places=10)
+
+        array_probs, _ = model.predict_proba_array(pd.DataFrame({'a': [0, 2]}), engine='exact')
+        self.assertListAlmostEqual(array_probs.tolist(), [[0.9, 0.1], [0.1, 0.9]], places=10)
+
+        # - predict takes states like predict_proba
+        self.assertRaisesWithMessage(
+            ValueError,
+            model.predict,
+            "Invalid states found: '1', '2' in 2 row(s) [0, 1] of a",
+            pd.DataFrame({'a': [1, 2]}), engine='exact'
+        )
+        self.assertListEqual(model.predict(pd.DataFrame({'a': ['1', '3']}), engine='exact')['b'].tolist(), ['No', 'Yes'])
+
+    def test_npt_change_recompiles(self):
+
+        # - Only the default engine is compiled unless the engines are named
+        profiler = self.model.enable_profiling()
+        self.model.compile()
+        self.assertListEqual(list(profiler.timings), ['compile_pomegranate'])
+
+        self.model.compile(['pomegranate', 'exact'])
+        self.model['b'].npt = [0.1, 0.1, 0.8]
+
+        for engine in ['pomegranate', 'exact']:
+            probs = self.model.predict_proba(X={'a': 'No'}, engine=engine)
+            self.assertListAlmostEqual(probs['b'], [0.1, 0.1, 0.8], places=6)
+
+    def test_deferred_tables(self):
+
+        # - pomegranate's parameter rows are only built when its engine is compiled
+        tables = [variable.npt for variable in self.model.variables if not variable.prior()]
+        self.model.predict_proba({'a': 'No'}, engine='exact')
+        self.assertTrue(all(table._deferred for table in tables))
+
+        probs = self.model.predict_proba({'a': 'No'})
+        self.assertFalse(any(table._deferred for table in tables))
+        self.assertListAlmostEqual(probs['b'], self.model.predict_proba({'a': 'No'}, engine='exact')['b'], places=6)
+
+    def test_fit_updates_npt(self):
+
+        X = self.model.sample(500)
+        X.columns = self.model.variable_ids
+        self.model.fit(X)
+
+        counts = X['b'].value_counts(normalize=True)
+        self.assertListAlmostEqual(self.model['b'].npt.values.tolist(), counts[self.model['b'].states].tolist(), places=10)
+
+        for engine in ['pomegranate', 'exact']:
+            probs = self.model.predict_proba(engine=engine)
+            self.assertListAlmostEqual(probs['b'], counts[self.model['b'].states].tolist(), places=6)
+
+    def test_fit_pseudocount(self):
+
+        X = self.model.sample(3)
+        X.columns = self.model.variable_ids
+        X['b'] = 'Low'
+
+        self.model.fit(X, pseudocount=1)
+        self.assertListAlmostEqual(self.model['b'].npt.values.tolist(), [4/6, 1/6, 1/6], places=10)
+
+    def test_fit_counts(self):
+
+        X = self.model.sample(2000, engine='forward', random_state=3)
+        X.columns = self.model.variable_ids
+
+        expected = base.create_test_model().fit(X.astype(str))
+        self.model.fit(X, engine='counts')
+
+        for variable in self.model.variables:
+            self.assertTrue(np.allclose(variable.npt.values, expected[variable.id].npt.values))
+
+        chunks = [X.iloc[:700], X.iloc[700:1500], X.iloc[1500:]]
+        chunked = base.create_test_model().fit(iter(chunks), engine='counts')
+
+        for variable in self.model.variables:
+            self.assertTrue(np.allclose(variable.npt.values, chunked[variable.id].npt.values))
+
+        # - Dirichlet pseudo-counts and rows with missing values
+        X = pd.DataFrame({'a': ['No', 'No', 'Yes', None], 'b': ['Low', None, 'Low', 'High']}, dtype=object)
+        self.model.fit(X, engine='counts', pseudocount={'a': 1, 'b': [1, 2, 1]})
+
+        self.assertListAlmostEqual(self.model['a'].npt.values.tolist(), [3/5, 2/5], places=10)
+        self.assertListAlmostEqual(self.model['b'].npt.values.tolist(), [3/7, 2/7, 2/7], places=10)
+
+    def test_fit_em(self):
+
+        X = self.model.sample(5000, engine='forward', random_state=4)
+        X.columns = self.model.variable_ids
+        X = X.astype(object)
+
+        # - Without missing values em converges to the counts estimate
+        expected = base.create_test_model().fit(X, engine='counts')
+        self.model.fit(X, engine='em')
+
+        for variable in self.model.variables:
+            self.assertTrue(np.allclose(variable.npt.values, expected[variable.id].npt.values))
+
+        # - With missing values the log-likelihood never decreases
+        X = X.mask(np.random.default_rng(5).random(X.shape) < 0.3)
+        model = base.create_test_model().fit(X, engine='em', tol=1e-3)
+
+        self.assertGreater(len(model.log_likelihoods), 2)
+        self.assertTrue((np.diff(model.log_likelihoods) > -1e-8).all())
+
+        probs = model.predict_proba(engine='exact')
+        for idx, values in expected.predict_proba(engine='exact').items():
+            self.assertListAlmostEqual(probs[idx], values, places=1)
+
+    def test_partial_fit(self):
+
+        X = self.model.sample(3000, engine='forward', random_state=6)
+        X.columns = self.model.variable_ids
+
+        expected = base.create_test_model().fit(X, engine='counts')
+
+        self.model.partial_fit(X.iloc[:1000])
+        self.assertEqual(self.model.counts['b'].sum(), 1000)
+
+        # - Resume from the statistics saved with the model
+        model = BayesianNetwork.from_dict(json.loads(self.model.to_json()))
+        model.partial_fit(X.iloc[1000:])
+
+        for variable in model.variables:
+            self.assertTrue(np.allclose(variable.npt.values, expected[variable.id].npt.values))
+
+        model.partial_fit(X.iloc[:10], decay=0.5)
+        self.assertEqual(model.counts['b'].sum(), 1510)
+
+        self.assertRaisesWithMessage(ValueError, model.partial_fit, 'decay must be greater than 0 and at most 1', X, decay=0)
+
+    def test_profiling(self):
+
+        calls = []
+        profiler = self.model.enable_profiling(callbacks=[lambda phase, elapsed: calls.append(phase)])
+
+        X = pd.DataFrame({'a': ['No', 'Yes', None, 'No'], 'f': ['Red', None, 'Blue', 'Red']}, dtype=object)
+        self.model.predict_proba(X, engine='exact')
+        self.model.predict_proba({'a': 'No'})
+
+        timings = profiler.timings
+        for phase in ['check', 'encode', 'patterns', 'compile_exact', 'compile_pomegranate', 'inference', 'assemble']:
+            self.assertIn(phase, timings)
+
+        self.assertEqual(timings['predict_proba']['count'], 2)
+        self.assertDictEqual(profiler.counters, {'rows': 4, 'patterns': 3})
+        self.assertEqual(len(calls), sum(timing['count'] for timing in timings.values()))
+
+        self.model.disable_profiling()
+        self.model.predict_proba(X, engine='exact')
+        self.assertIsNone(self.model.profiler)
+        self.assertEqual(profiler.timings['predict_proba']['count'], 2)
+
+    def test_query_cache(self):
+
+        cache = self.model.enable_query_cache(maxsize=2)
+        expected = self.model.predict_proba({'a': 'No', 'c': 'Positive'}, engine='exact')
+
+        probs = self.model.predict_proba({'c': 'Positive', 'a': 'No'}, engine='exact')
+        self.assertDictEqual(probs, expected)
+        self.assertDictEqual(cache.info(), {'hits': 1, 'misses': 1, 'size': 1, 'maxsize': 2})
+
+        # - Evidence given as None leaves the observed evidence unchanged but not the outputs
+        probs = self.model.predict_proba({'a': 'No', 'c': 'Positive', 'd': None}, engine='exact')
+        self.assertListEqual(list(probs), ['b', 'e', 'f'])
+        self.assertDictEqual(probs, {idx: expected[idx] for idx in ['b', 'e', 'f']})
+        self.assertDictEqual(cache.info(), {'hits': 1, 'misses': 2, 'size': 2, 'maxsize': 2})
+
+        # - Results are copies
+        probs['b'][0] = 1
+        self.assertDictEqual(self.model.predict_proba({'a': 'No', 'c': 'Positive'}, engine='exact'), expected)
+
+        # - Least recently used results are dropped
+        self.model.predict_proba({'a': 'Yes'}, engine='exact')
+        self.model.predict_proba({'a': 'Yes'})
+        self.assertEqual(len(cache), 2)
+
+        # - Changing an npt clears the cache
+        self.model['b'].npt = [0.1, 0.1, 0.8]
+        self.assertEqual(len(cache), 0)
+        self.assertListAlmostEqual(self.model.predict_proba({'a': 'No'}, engine='exact')['b'], [0.1, 0.1, 0.8], places=10)
+
+    def test_sample_positional_args(self):
+
+        # - Positional arguments are passed on to pomegranate as (n, evidences, algorithm, random_state)
+        samples = self.model.sample(5, [{}], 'rejection', 0)
+        self.assertListEqual(list(samples.columns), self.model.variable_names)
+        self.assertTrue(samples.equals(self.model.sample(5, [{}], random_state=0)))
+
+        self.assertRaisesWithMessage(
+            TypeError, self.model.sample,
+            "Positional arguments after n are only supported by the 'pomegranate' engine", 5, [{}], engine='forward'
+        )
+
+    def test_forward_sample(self):
+
+        samples = self.model.sample(20000, engine='forward', random_state=1)
+        self.assertListEqual(list(samples.columns), self.model.variable_names)
+
+        probs = self.model.predict_proba(engine='exact')
+        for variable in self.model.variables:
+            self.assertListEqual(list(samples[variable.name].cat.categories), variable.states)
+            frequencies = samples[variable.name].value_counts(normalize=True)[variable.states]
+            self.assertListAlmostEqual(frequencies.tolist(), probs[variable.id], places=1)
+
+        codes = self.model.sample(100, engine='forward', random_state=2, output='codes')
+        chunks = list(self.model.sample(100, engine='forward', random_state=2, output='codes', chunk_size=40))
+
+        self.assertEqual(codes.shape, (100, 6))
+        self.assertListEqual([len(chunk) for chunk in chunks], [40, 40, 20])
+        self.assertTrue((codes == self.model.sample(100, engine='forward', random_state=2, output='codes')).all())
+
+    def test_sample_to_file(self):
+
+        samples = pd.concat(self.model.sample(250, engine='forward', random_state=1, chunk_size=100), ignore_index=True)
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'samples.csv')
+            self.model.sample_to_file(filename, 250, chunk_size=100, random_state=1)
+            self.assertTrue(pd.read_csv(filename).equals(samples.astype(str)))
+
+            try:
+                import pyarrow
+            except ImportError:
+                return
+
+            filename = os.path.join(directory, 'samples.parquet')
+            self.model.sample_to_file(filename, 250, chunk_size=100, random_state=1)
+            self.assertTrue(pd.read_parquet(filename).astype(str).equals(samples.astype(str)))
+
+
+class TestImport(unittest.TestCase):
+
+    # - Seconds allowed for import bn_zest, which defers pomegranate and pandas
+    IMPORT_BUDGET = 0.25
+
+    # - Seconds allowed for importing BayesianNetwork on top of its dependencies
+    MODEL_IMPORT_BUDGET = 0.25
+
+    def run_script(self, script):
+        output = subprocess.run([sys.executable, '-c', script], cwd=base.ROOT_DIR, capture_output=True, text=True, check=True)
+        return output.stdout.split()
+
+    def test_import_time(self):
+
+        elapsed, pomegranate, pandas = self.run_script(
+            'import sys, time; start = time.perf_counter(); import bn_zest; '
+            'print(time.perf_counter() - start, "pomegranate" in sys.modules, "pandas" in sys.modules)'
+        )
+
+        self.assertLess(float(elapsed), self.IMPORT_BUDGET, f'import bn_zest took {float(elapsed):.3f}s')
+        self.assertEqual((pomegranate, pandas), ('False', 'False'))
+
+    def test_model_import_time(self):
+
+        # - The common case imports the model, whose time is dominated by
+        # pomegranate and pandas, so only the time on top of them is budgeted
+        elapsed, = self.run_script(
+            'import time, numpy, pandas, pomegranate; start = time.perf_counter(); '
+            'from bn_zest import Node, BayesianNetwork; print(time.perf_counter() - start)'
+        )
+
+        self.assertLess(float(elapsed), self.MODEL_IMPORT_BUDGET, f'from bn_zest import BayesianNetwork took {float(elapsed):.3f}s')
+
+    def test_utility_imports(self):
+
+        pomegranate, pandas = self.run_script(
+            'import sys; from bn_zest import Profiler, QueryCache; '
+            'print("pomegranate" in sys.modules, "pandas" in sys.modules)'
+        )
+
+        self.assertEqual((pomegranate, pandas), ('False', 'False'))
+
+    def test_lazy_attributes(self):
+
+        import bn_zest
+
+        self.assertIs(bn_zest.BayesianNetwork, BayesianNetwork)
+        self.assertIs(bn_zest.Node, Node)
+        self.assertRaises(AttributeError, getattr, bn_zest, 'Network')
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,7 +1,10 @@
+import json
 import os
+import tempfile
 import unittest
 from . import base
 from bn_zest import BayesianNetwork
+from bn_zest.parsers import to_cmpx
 
 
 class TestCMPXParser(base.ErrorTestMixin, unittest.TestCase):
@@ -32,7 +35,56 @@ class TestCMPXParser(base.ErrorTestMixin, unittest.TestCase):
         self.save_model(model, 'test_output_model.cmpx')
         model = self.load_model('test_output_model.cmpx')
         self.assertIsInstance(model, BayesianNetwork)
-        
+
+    def test_cmpx_multiple_networks(self):
+
+        model = base.create_test_model()
+        data = to_cmpx(model)
+
+        second = to_cmpx(BayesianNetwork('Second network', variables=[base.create_test_model()['b']]))['model']['networks'][0]
+        data['model']['networks'].append(second)
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'networks.cmpx')
+            with open(filename, 'w') as file:
+                json.dump(data, file)
+
+            self.assertListEqual(BayesianNetwork.list_cmpx_networks(filename), [
+                {'index': 0, 'id': 'zest_test_network', 'name': 'Zest test network', 'n_nodes': 6},
+                {'index': 1, 'id': 'secondnetwork', 'name': 'Second network', 'n_nodes': 1}
+            ])
+
+            self.assertEqual(BayesianNetwork.from_cmpx(filename, network='Second network', remove_disconnected_variables=False).name, 'Second network')
+
+            models = BayesianNetwork.from_cmpx_networks(filename, remove_disconnected_variables=False)
+            self.assertListEqual(list(models.keys()), ['Zest test network', 'Second network'])
+            self.assertListEqual(models['Zest test network'].variable_ids, model.variable_ids)
+
+            models = BayesianNetwork.from_cmpx_networks(filename, networks=['Zest test network', 1], remove_disconnected_variables=False)
+            self.assertListEqual(list(models.keys()), ['Zest test network', 1])
+            self.assertListEqual(models[1].variable_ids, ['b'])
+
+            self.assertRaisesWithMessage(
+                KeyError,
+                BayesianNetwork.from_cmpx,
+                "\"The network 'Third network' does not match any contained in the file\"",
+                filename, network='Third network'
+            )
+
+            # - Networks sharing a name can only be loaded by index
+            data['model']['networks'].append(second)
+            with open(filename, 'w') as file:
+                json.dump(data, file)
+
+            self.assertRaisesWithMessage(
+                ValueError,
+                BayesianNetwork.from_cmpx_networks,
+                f'The networks in {filename} do not have unique names, load them by index instead',
+                filename
+            )
+
+            models = BayesianNetwork.from_cmpx_networks(filename, networks=[1, 2], remove_disconnected_variables=False)
+            self.assertListEqual(list(models.keys()), [1, 2])
 
 
 class TestJSONParser(base.ErrorTestMixin, unittest.TestCase):
@@ -56,3 +108,83 @@ class TestJSONParser(base.ErrorTestMixin, unittest.TestCase):
             "The probabilities for a do not sum to 1. Please change or use force_summation=True when reading from file",
             model_path
         )
+
+
+class TestBNZParser(base.ErrorTestMixin, unittest.TestCase):
+
+    def test_model_bnz_round_trip(self):
+
+        model = self.load_model('bendi_bn_test.cmpx')
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'model.bnz')
+            model.to_bnz(filename)
+
+            # - The header length is little-endian whatever the platform
+            with open(filename, 'rb') as file:
+                content = file.read()
+            length = int.from_bytes(content[4:12], 'little')
+            self.assertEqual(json.loads(content[12:12 + length])['version'], 1)
+
+            for mmap in [True, False]:
+                loaded = BayesianNetwork.from_bnz(filename, mmap=mmap)
+                self.assertEqual(json.dumps(loaded.to_dict()), json.dumps(model.to_dict()))
+                self.assertFalse(loaded.variables[-1].npt.values.flags['WRITEABLE'])
+
+            del loaded
+
+    def test_bnz_deferred_tables(self):
+
+        model = base.create_test_model()
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'model.bnz')
+            model.to_bnz(filename)
+            loaded = BayesianNetwork.from_bnz(filename)
+
+        # - The pomegranate tables are built when the pomegranate engine is first used
+        self.assertTrue(loaded['e'].npt._deferred)
+        self.assertDictEqual(loaded.predict_proba({'a': 'No'}), model.predict_proba({'a': 'No'}))
+        self.assertFalse(loaded['e'].npt._deferred)
+
+        loaded = BayesianNetwork.from_dict(model.to_dict(), trusted=True)
+        loaded['b'].npt = [0.1, 0.1, 0.8]
+        self.assertListAlmostEqual(loaded.predict_proba({'a': 'No'})['b'], [0.1, 0.1, 0.8], places=10)
+        self.assertEqual(len(loaded.sample(5)), 5)
+
+    def test_bnz_fail(self):
+
+        model_path = os.path.join(base.MODELS_DIR, 'test_input_model.json')
+        self.assertRaisesWithMessage(ValueError, BayesianNetwork.from_bnz, f'{model_path} is not a bnz file', model_path)
+
+        # - Files from a newer version of the format are refused rather than misread
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'model.bnz')
+            base.create_test_model().to_bnz(filename)
+
+            with open(filename, 'rb') as file:
+                content = file.read()
+            with open(filename, 'wb') as file:
+                file.write(content.replace(b'"version": 1', b'"version": 9', 1))
+
+            self.assertRaisesWithMessage(ValueError, BayesianNetwork.from_bnz, f'{filename} is bnz version 9, only version 1 can be read', filename)
+
+
+class TestDictParser(base.ErrorTestMixin, unittest.TestCase):
+
+    def test_variable_order(self):
+
+        data = base.create_test_model().to_dict()
+        data['variables'] = data['variables'][::-1]
+
+        model = BayesianNetwork.from_dict(data)
+        self.assertListEqual(model.variable_ids, ['f', 'e', 'd', 'c', 'b', 'a'])
+        self.assertListEqual([parent.id for parent in model['e'].parents], ['c', 'd'])
+
+    def test_cycle_fail(self):
+
+        data = base.create_test_model().to_dict()
+        data['variables'][0]['parents'] = ['f']
+        data['variables'][0]['npt'] = [[0.5, 0.5, 0.5], [0.5, 0.5, 0.5]]
+
+        self.assertRaisesWithMessage(ValueError, BayesianNetwork.from_dict, 'The network contains a cycle', data)
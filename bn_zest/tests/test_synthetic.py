@@ -0,0 +1,40 @@
+import unittest
+import numpy as np
+from . import base
+from bn_zest import BayesianNetwork
+from bn_zest.synthetic import random_network
+
+
+class TestRandomNetwork(base.ErrorTestMixin, unittest.TestCase):
+
+    def test_random_network(self):
+
+        model = random_network(200, n_states=(2, 4), max_in_degree=3, treewidth=4, seed=0)
+
+        self.assertIsInstance(model, BayesianNetwork)
+        self.assertEqual(len(model), 200)
+
+        for i, variable in enumerate(model.variables):
+            self.assertIn(len(variable), [2, 3, 4])
+
+            parents = [model.variable_index[parent.id] for parent in (variable.parents or [])]
+            self.assertLessEqual(len(parents), 3)
+            self.assertTrue(all(i - 4 <= j < i for j in parents))
+
+        self.assertLessEqual(max(len(clique) for clique in model._get_junction_tree().cliques), 5)
+
+    def test_random_network_seed(self):
+
+        a, b = random_network(30, seed=1), random_network(30, seed=1)
+        self.assertEqual(a.to_json(), b.to_json())
+
+        probs = a.predict_proba(engine='exact')
+        for variable in a.variables:
+            self.assertAlmostEqual(np.sum(probs[variable.id]), 1, places=10)
+
+    def test_random_network_fail(self):
+        self.assertRaisesWithMessage(ValueError, random_network, 'treewidth must be at least 1', 10, treewidth=0)
+
+
+if __name__ == '__main__':
+    unittest.main()